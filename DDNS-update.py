@@ -1,85 +1,926 @@
+import heapq
+import itertools
 import time
 import os
-import requests
 import sys
+import atexit
+import errno
+import ipaddress
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import select
+import socket
+import struct
+import threading
+from collections import deque, namedtuple
+from functools import lru_cache
+
+# Heavy modules are imported on first use to keep startup light:
+# requests (HTTPBACKEND=requests), http.client/ssl (HTTPBACKEND=lite),
+# asyncio (ENGINE=async), concurrent.futures (several IPURL providers),
+# configparser/tomllib (CONFIGFILE).
+asyncio = None
+
+# --- Config File ---
+# CONFIGFILE points to an INI file like ddns.ini, or a TOML file (*.toml).
+# [DEFAULT] keys (top-level keys in TOML) fill in environment variables that
+# are not set; every other section (table) is a target record, named by the
+# section, and target sections are reloaded while running when the file changes.
+
+def read_config_file(path):
+    """
+    Reads an INI or TOML config file. Returns (settings, sections): settings
+    maps upper-case setting names to strings, and sections maps each target
+    section name to its settings, with the defaults folded in.
+    Raises OSError or ValueError if the file cannot be read or parsed.
+    """
+    def as_text(value):
+        return str(value).lower() if isinstance(value, bool) else str(value)
+
+    if path.endswith(".toml"):
+        import tomllib
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+        settings = {k.upper(): as_text(v) for k, v in data.items() if not isinstance(v, dict)}
+        sections = {name: dict(settings, **{k.upper(): as_text(v) for k, v in table.items()})
+                    for name, table in data.items() if isinstance(table, dict)}
+        return settings, sections
+
+    import configparser
+    parser = configparser.ConfigParser(inline_comment_prefixes=(";",), interpolation=None)
+    try:
+        with open(path) as f:
+            parser.read_file(f)
+    except configparser.Error as e:
+        raise ValueError(str(e)) from e
+    settings = {k.upper(): v for k, v in parser.defaults().items()}
+    sections = {name: {k.upper(): v for k, v in parser[name].items()} for name in parser.sections()}
+    return settings, sections
+
+config_file = os.getenv("CONFIGFILE")
+config_file_error = None
+config_sections = {}
+if config_file:
+    try:
+        config_settings, config_sections = read_config_file(config_file)
+    except (OSError, ValueError) as e:
+        config_file_error = str(e)
+    else:
+        for setting_name, setting_value in config_settings.items():
+            if setting_value:
+                os.environ.setdefault(setting_name, setting_value)
+
+# --- Logging ---
+# LOGLEVEL: DEBUG, INFO (default), WARNING, ERROR or CRITICAL
+# LOGFORMAT: "text" ("[INFO] message") or "json" (one JSON object per line)
+# LOGASYNC: format in the caller but write from a background thread (default true)
+
+class TextFormatter(logging.Formatter):
+    """Formats records as "[LEVEL] message", matching the script's historical output."""
+
+    LEVEL_TAGS = {"WARNING": "WARN", "CRITICAL": "FATAL"}
+
+    def format(self, record):
+        line = f"[{self.LEVEL_TAGS.get(record.levelname, record.levelname)}] {record.getMessage()}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats records as JSON lines. Fields passed as extra={"fields": {...}} are merged in."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname.lower(),
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, separators=(",", ":"), default=str)
+
+def configure_logging(level_name="INFO", log_format="text", async_output=True, stream=None):
+    """
+    (Re)configures the "ddns" logger and returns it. With async_output, records
+    are queued and written to the stream by a QueueListener thread that is
+    flushed at exit.
+    """
+    logger = logging.getLogger("ddns")
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        if getattr(handler, "listener", None) is not None:
+            handler.listener.stop()
+            handler.listener = None
+    level = logging.getLevelName((level_name or "INFO").upper())
+    if not isinstance(level, int):
+        level = logging.INFO
+    stream_handler = logging.StreamHandler(stream or sys.stdout)
+    stream_handler.setFormatter(JsonLinesFormatter() if log_format == "json" else TextFormatter())
+    handler = stream_handler
+    if async_output:
+        log_queue = queue.SimpleQueue()
+        handler = logging.handlers.QueueHandler(log_queue)
+        handler.listener = logging.handlers.QueueListener(log_queue, stream_handler)
+        handler.listener.start()
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
+
+def flush_logging():
+    """Stops the background log writer, flushing queued records."""
+    for handler in logging.getLogger("ddns").handlers:
+        if getattr(handler, "listener", None) is not None:
+            handler.listener.stop()
+            handler.listener = None
+
+class RepeatSummarizer:
+    """Lets a repeated message through the first time and then once every `every` repeats."""
+
+    def __init__(self, every):
+        self.every = every
+        self.counts = {}
+
+    def hit(self, key):
+        """Counts a repeat. Returns the running count if it should be logged, else 0."""
+        count = self.counts.get(key, 0) + 1
+        self.counts[key] = count
+        return count if count == 1 or count % self.every == 0 else 0
+
+    def reset(self, key):
+        self.counts.pop(key, None)
+
+log_format = (os.getenv("LOGFORMAT") or "text").lower()
+log = configure_logging(
+    os.getenv("LOGLEVEL") or "INFO",
+    log_format,
+    (os.getenv("LOGASYNC") or "true").lower() in ("1", "true", "yes"),
+)
+atexit.register(flush_logging)
 
 # --- Configuration & Environment Variables ---
 # These are typically set in your environment (e.g., Dockerfile, .env file, system variables)
 domain_env = os.getenv("DOMAIN")  # e.g., example.com (your zone name)
 name_env = os.getenv("NAME")  # e.g., dyndns, www, or @ for root. If not FQDN, DOMAIN will be appended.
-record_type_env = os.getenv("RECORDTYPE") or "A"
-ip_url = os.getenv("IPURL") or "https://ifconfig.me"
+record_type_env = os.getenv("RECORDTYPE") or "A" # A, AAAA, or "A,AAAA" to keep both records of a name
+record_types = list(dict.fromkeys(t.strip().upper() for t in record_type_env.split(",") if t.strip())) or ["A"]
+record_type_env = record_types[0]
+ip_url = os.getenv("IPURL") or "https://ifconfig.me" # One URL, or a comma-separated list queried in parallel
 token = os.getenv("TOKEN") # Cloudflare API token with DNS read/write access
 zone_id = os.getenv("ZONEID") # The Zone ID of your domain in Cloudflare
 record_id_env = os.getenv("RECORDID") # Optional: if you know the specific record ID
 selected_item_env = os.getenv("SELECTEDITEM") # Optional: index if NAME+TYPE yields multiple records
+targets_env = os.getenv("TARGETS") # Optional: fleet mode, comma-separated ZONEID:NAME[:TYPE] entries
 
 # Update interval
 update_interval_str = os.getenv("UPDATEINTERVAL")
 if update_interval_str and update_interval_str.isdigit():
     update_interval = int(update_interval_str)
     if update_interval < 60: # Minimum sensible interval
-        print(f"[WARN] UPDATEINTERVAL '{update_interval}' is very short. Setting to 60 seconds.")
+        log.warning(f"UPDATEINTERVAL '{update_interval}' is very short. Setting to 60 seconds.")
         update_interval = 60
 else:
     update_interval = 300 # Default 5 minutes
     if update_interval_str :
-        print(f"[WARN] Invalid UPDATEINTERVAL value '{update_interval_str}', using default {update_interval}s.")
+        log.warning(f"Invalid UPDATEINTERVAL value '{update_interval_str}', using default {update_interval}s.")
 
-# TTL for the DNS record
+# TTL for the DNS record. Like PROXIED it is enforced only when set (None leaves the record's TTL alone)
 ttl_str = os.getenv("TTL")
 if ttl_str and ttl_str.isdigit():
     ttl = int(ttl_str)
     if ttl < 1: # Cloudflare: 1 means "Auto", otherwise usually >=60 for specific durations
-        print(f"[WARN] TTL value '{ttl}' is less than 1. Setting to 1 (auto).")
+        log.warning(f"TTL value '{ttl}' is less than 1. Setting to 1 (auto).")
         ttl = 1
-elif ttl_str == "1": # Explicitly "1" for Auto TTL
-    ttl = 1
 else:
-    ttl = 1 # Default TTL (1 = Auto)
+    ttl = None
     if ttl_str:
-        print(f"[WARN] Invalid TTL value '{ttl_str}', using default TTL {ttl} (auto).")
+        log.warning(f"Invalid TTL value '{ttl_str}'. Leaving the record TTL unchanged.")
+
+# Shared HTTP session: connection pool size and retry policy
+def _env_int(name, default, minimum=0):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    if value.isdigit() and int(value) >= minimum:
+        return int(value)
+    log.warning(f"Invalid {name} value '{value}', using default {default}.")
+    return default
+
+http_pool_size = _env_int("HTTPPOOLSIZE", 10, minimum=1)
+http_retries = _env_int("HTTPRETRIES", 3)
+http_backoff_max = _env_int("HTTPBACKOFFMAX", 30)
+
+# Public IP providers: how many must agree, and how many are queried at once
+ip_urls = [u.strip() for u in ip_url.split(",") if u.strip()]
+ip_quorum = _env_int("IPQUORUM", 1, minimum=1)
+if ip_quorum > len(ip_urls):
+    log.warning(f"IPQUORUM '{ip_quorum}' exceeds the {len(ip_urls)} configured IPURL provider(s). Using {len(ip_urls)}.")
+    ip_quorum = len(ip_urls)
+ip_race_width = _env_int("IPRACEWIDTH", len(ip_urls), minimum=1)
+# Bind A lookups to IPv4 and AAAA lookups to IPv6, so dual-stack providers
+# answer with the address of the family being updated
+ip_family_bind = (os.getenv("IPFAMILYBIND") or "true").lower() in ("1", "true", "yes")
+
+# Adaptive interval: waits stretch from UPDATEINTERVAL toward INTERVALMAX while
+# the IP is stable, snap back after a change or failure, and vary by
+# +/- INTERVALJITTER percent so restarted instances drift out of phase
+interval_max = _env_int("INTERVALMAX", update_interval, minimum=60)
+if interval_max < update_interval:
+    log.warning(f"INTERVALMAX '{interval_max}' is below UPDATEINTERVAL. Using {update_interval}.")
+    interval_max = update_interval
+interval_jitter = _env_int("INTERVALJITTER", 10)
+if interval_jitter > 50:
+    log.warning(f"INTERVALJITTER '{interval_jitter}' is above 50 percent. Using 50.")
+    interval_jitter = 50
+
+# Local address watching: "off" polls every UPDATEINTERVAL, "netlink" or "poll"
+# only check after a local address change, with WATCHFALLBACKINTERVAL as safety net
+watch_mode = (os.getenv("WATCHMODE") or "off").lower()
+if watch_mode not in ("off", "netlink", "poll"):
+    log.warning(f"Invalid WATCHMODE value '{watch_mode}', using 'off'.")
+    watch_mode = "off"
+watch_fallback_interval = _env_int("WATCHFALLBACKINTERVAL", 1800, minimum=60)
+watch_poll_interval = _env_int("WATCHPOLLINTERVAL", 5, minimum=1)
+
+# Cloudflare API rate limit per token (requests per window) and 429 retries
+cf_rate_limit = _env_int("CFRATELIMIT", 1200, minimum=1)
+cf_rate_window = _env_int("CFRATEWINDOW", 300, minimum=1)
+cf_throttle_retries = _env_int("CFTHROTTLERETRIES", 3)
+
+# Cloudflare API base URL; override to point the script at a local stand-in
+cf_api_url = (os.getenv("CFAPIURL") or "https://api.cloudflare.com/client/v4").rstrip("/")
+
+# Optional Prometheus metrics endpoint (disabled unless METRICSPORT is set)
+metrics_port = _env_int("METRICSPORT", 0)
+metrics_addr = os.getenv("METRICSADDR") or "0.0.0.0"
+
+# HTTP backend: "requests" (default) or "lite" (stdlib http.client, no third-party imports)
+http_backend = (os.getenv("HTTPBACKEND") or "requests").lower()
+if http_backend not in ("requests", "lite"):
+    log.warning(f"Invalid HTTPBACKEND value '{http_backend}', using 'requests'.")
+    http_backend = "requests"
+
+# Update engine: "sync" (one record at a time) or "async" (asyncio, bounded concurrency)
+engine = (os.getenv("ENGINE") or "sync").lower()
+if engine not in ("sync", "async"):
+    log.warning(f"Invalid ENGINE value '{engine}', using 'sync'.")
+    engine = "sync"
+async_workers = _env_int("ASYNCWORKERS", 8, minimum=1)
+async_task_timeout = _env_int("ASYNCTASKTIMEOUT", 60, minimum=1)
+
+# Batch updates: changed records of one zone are sent together to /dns_records/batch
+batch_updates = (os.getenv("BATCHUPDATES") or "false").lower() in ("1", "true", "yes")
+batch_size = _env_int("BATCHSIZE", 200, minimum=1)
+
+# Desired record state beyond the IP: PROXIED is enforced only when set,
+# COMMENTPOLICY "stamp" rewrites the comment on IP changes and "off" leaves it
+# alone. Every VERIFYEVERY cycles (0 = never) records are re-read so edits made
+# outside this script are detected and reconciled.
+proxied_env = (os.getenv("PROXIED") or "").lower()
+desired_proxied = None if not proxied_env else proxied_env in ("1", "true", "yes")
+comment_policy = (os.getenv("COMMENTPOLICY") or "stamp").lower()
+if comment_policy not in ("stamp", "off"):
+    log.warning(f"Invalid COMMENTPOLICY value '{comment_policy}', using 'stamp'.")
+    comment_policy = "stamp"
+verify_every = _env_int("VERIFYEVERY", 12)
+
+# Optional state file caching resolved records across restarts
+state_file = os.getenv("STATEFILE")
+
+# Repeated "no update needed" / lookup failure messages are summarized every N cycles
+log_summary = RepeatSummarizer(_env_int("LOGSUMMARYEVERY", 12, minimum=1))
+
+# Largest page size accepted by the Cloudflare DNS records listing
+DNS_RECORDS_PER_PAGE = 5000
+
+# While a zone's listing page count is unknown, up to this many records are
+# read one by one rather than fetching a full first page to learn it
+SINGLE_READS_BEFORE_PROBE = 2
 
 # --- Helper Functions ---
 def get_current_timestamp():
     """Returns a formatted current timestamp."""
     return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))
 
+@lru_cache(maxsize=None)
 def get_headers(cf_token):
-    """Builds the standard headers for Cloudflare API requests."""
+    """Builds the standard headers for Cloudflare API requests (cached per token)."""
     return {
         "Authorization": f"Bearer {cf_token}",
         "Content-Type": "application/json",
     }
 
-def get_public_ip(url_to_fetch_ip):
-    """Fetches the public IP address from a given URL."""
+# --- HTTP Backends ---
+
+class LiteHTTPErrors:
+    """Exceptions raised by the lite backend, mirroring requests.exceptions."""
+
+    class RequestException(IOError):
+        pass
+
+    class HTTPError(RequestException):
+        pass
+
+    class ConnectionError(RequestException):
+        pass
+
+    class Timeout(RequestException):
+        pass
+
+# Exception namespace of the active backend; swapped for requests.exceptions
+# when the requests backend is loaded.
+http_errors = LiteHTTPErrors
+
+class LiteResponse:
+    """The subset of requests.Response used by this script."""
+
+    def __init__(self, method, url, status_code, reason, headers, content):
+        self.method = method
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise LiteHTTPErrors.HTTPError(f"{self.status_code} {self.reason} for url: {self.url}")
+
+_tls_context = None
+_tls_context_lock = threading.Lock()
+
+def get_tls_context():
+    """Returns the TLS context shared by every LiteSession, created on first use."""
+    global _tls_context
+    with _tls_context_lock:
+        if _tls_context is None:
+            import ssl
+            _tls_context = ssl.create_default_context()
+        return _tls_context
+
+class LiteSession:
+    """
+    Minimal HTTP/1.1 client on http.client with keep-alive connections pooled
+    per host, one shared TLS context, and capped exponential backoff retries
+    for connection errors and 5xx responses.
+    """
+
+    RETRY_STATUSES = (500, 502, 503, 504)
+    _dumps = staticmethod(json.dumps)
+
+    def __init__(self, pool_size, retries, backoff_max, source_address=None):
+        import http.client
+        from urllib.parse import urlencode, urlsplit
+        self._http_client = http.client
+        self._urlencode = urlencode
+        self._urlsplit = urlsplit
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff_max = backoff_max
+        self.source_address = source_address
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, scheme, host, port, timeout):
+        if scheme == "https":
+            return self._http_client.HTTPSConnection(host, port, timeout=timeout, context=get_tls_context(),
+                                                     source_address=self.source_address)
+        return self._http_client.HTTPConnection(host, port, timeout=timeout, source_address=self.source_address)
+
+    def _checkout(self, key, timeout):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                conn = idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+        return self._connect(*key, timeout), False
+
+    def _checkin(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.pool_size:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, method, url, headers=None, json=None, params=None, timeout=None):
+        parts = self._urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+        query = "&".join(q for q in (parts.query, self._urlencode(params or {})) if q)
+        if query:
+            path += "?" + query
+        request_headers = {"Accept": "*/*", "User-Agent": "ddns-updater"}
+        request_headers.update(headers or {})
+        body = None
+        if json is not None:
+            body = self._dumps(json).encode()
+            request_headers["Content-Type"] = "application/json"
+
+        attempt = 0
+        while True:
+            conn, reused = self._checkout(key, timeout)
+            try:
+                conn.request(method, path, body=body, headers=request_headers)
+                raw = conn.getresponse()
+                content = raw.read()
+            except (TimeoutError, socket.timeout) as e:
+                conn.close()
+                error = LiteHTTPErrors.Timeout(f"{method} {url} timed out: {e}")
+            except (OSError, self._http_client.HTTPException) as e:
+                conn.close()
+                if reused:
+                    continue # stale keep-alive connection: retry once on a fresh one
+                error = LiteHTTPErrors.ConnectionError(f"{method} {url} failed: {e!r}")
+            else:
+                if raw.will_close:
+                    conn.close()
+                else:
+                    self._checkin(key, conn)
+                response = LiteResponse(method, url, raw.status, raw.reason, raw.headers, content)
+                if raw.status not in self.RETRY_STATUSES or attempt >= self.retries:
+                    return response
+                error = None
+            if attempt >= self.retries:
+                raise error
+            time.sleep(min(0.5 * (2 ** attempt), self.backoff_max))
+            attempt += 1
+
+def create_http_session(source_address=None):
+    """
+    Creates a pooled session for the configured HTTPBACKEND. source_address
+    binds outgoing connections to one local address (and so one IP family).
+    """
+    global http_errors
+    if http_backend == "lite":
+        return LiteSession(http_pool_size, http_retries, http_backoff_max, source_address)
+
+    import requests
+    http_errors = requests.exceptions
+    session = requests.Session()
+    retry_policy = requests.adapters.Retry(
+        total=http_retries,
+        backoff_factor=0.5,
+        backoff_max=http_backoff_max,
+        status_forcelist=(500, 502, 503, 504), # 429 is handled by the RequestScheduler
+        allowed_methods=frozenset({"GET", "PATCH", "POST"}),
+        respect_retry_after_header=False, # else urllib3 retries 429s carrying Retry-After itself
+        raise_on_status=False,
+    )
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=http_pool_size,
+        pool_maxsize=http_pool_size,
+        max_retries=retry_policy,
+    )
+    if source_address:
+        adapter.init_poolmanager(http_pool_size, http_pool_size, source_address=source_address)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+_http_sessions = {}
+_http_session_lock = threading.Lock()
+
+def get_http_session(source_address=None):
+    """
+    Returns the shared HTTP session, creating it on first use.
+    The session keeps connections alive in a pool of HTTPPOOLSIZE per host and
+    retries connection errors and 5xx responses HTTPRETRIES times with
+    exponential backoff capped at HTTPBACKOFFMAX seconds.
+    Each source_address gets its own session.
+    """
+    with _http_session_lock:
+        session = _http_sessions.get(source_address)
+        if session is None:
+            session = _http_sessions[source_address] = create_http_session(source_address)
+    return session
+
+# Number of HTTP requests sent, reported once setup completes
+http_request_count = 0
+
+def http_request(method, url, source_address=None, **kwargs):
+    """Sends a request through the shared session (bound to source_address, if given) and logs its latency."""
+    global http_request_count
+    http_request_count += 1
+    request_start = time.perf_counter()
+    response = get_http_session(source_address).request(method, url, **kwargs)
+    elapsed_ms = (time.perf_counter() - request_start) * 1000
+    log.debug("%s %s -> %s in %.1f ms", method, url, response.status_code, elapsed_ms)
+    return response
+
+# --- Metrics ---
+
+# Latency buckets in seconds, shared by every histogram
+METRIC_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Metrics:
+    """Minimal thread-safe Prometheus registry: labeled counters, histograms and gauges."""
+
+    def __init__(self, buckets=METRIC_BUCKETS):
+        self.buckets = buckets
+        self.descriptions = {}
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, help_text):
+        self.descriptions[name] = (kind, help_text)
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            bucket_counts, total, observations = self.histograms.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    bucket_counts[i] += 1
+            self.histograms[key] = (bucket_counts, total + value, observations + 1)
+
+    def gauge(self, name, callback):
+        """Registers a gauge whose value is read from callback() at scrape time."""
+        self.gauges[name] = callback
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+    def render(self):
+        """Returns the registry in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {k: (list(v[0]), v[1], v[2]) for k, v in self.histograms.items()}
+        for name, (kind, help_text) in sorted(self.descriptions.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{self._format_labels(labels)} {value}")
+            elif kind == "histogram":
+                for (metric, labels), (bucket_counts, total, observations) in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(self.buckets, bucket_counts):
+                        lines.append(f"{name}_bucket{self._format_labels(labels + (('le', str(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{self._format_labels(labels + (('le', '+Inf'),))} {observations}")
+                    lines.append(f"{name}_sum{self._format_labels(labels)} {total}")
+                    lines.append(f"{name}_count{self._format_labels(labels)} {observations}")
+            elif kind == "gauge" and name in self.gauges:
+                lines.append(f"{name} {self.gauges[name]()}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+metrics.describe("ddns_ip_lookup_seconds", "histogram", "Latency of public IP lookups per provider.")
+metrics.describe("ddns_ip_lookup_failures_total", "counter", "Failed or invalid public IP lookups per provider.")
+metrics.describe("ddns_cloudflare_request_seconds", "histogram", "Latency of Cloudflare API requests per method and zone.")
+metrics.describe("ddns_loop_iteration_seconds", "histogram", "Duration of one check cycle, excluding the wait.")
+metrics.describe("ddns_updates_total", "counter", "Successful DNS record updates per record.")
+metrics.describe("ddns_update_failures_total", "counter", "Failed DNS record updates per record.")
+metrics.describe("ddns_update_skips_total", "counter", "Checks where the record already matched the public IP.")
+metrics.describe("ddns_drift_detected_total", "counter", "Records found changed outside this script by periodic verification.")
+metrics.describe("ddns_throttles_total", "counter", "Cloudflare 429 responses per zone.")
+metrics.describe("ddns_scheduler_queue_depth", "gauge", "Cloudflare requests waiting in the rate-limit scheduler.")
+
+def start_metrics_server(port, addr="0.0.0.0"):
+    """Serves /metrics from a daemon thread. Returns the server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log.info(f"Metrics endpoint listening on http://{addr}:{server.server_address[1]}/metrics")
+    return server
+
+def zone_from_url(url):
+    """Extracts the zone ID from a Cloudflare API URL, for metric labels."""
+    return url.split("/zones/", 1)[1].split("/", 1)[0] if "/zones/" in url else ""
+
+# --- Cloudflare Rate Limiting ---
+
+class SlidingWindowLimit:
+    """
+    Allows at most `limit` requests in any `window` seconds, counting the send
+    times of the requests still inside the window (a token bucket that starts
+    full would allow up to twice the limit in its first window).
+    """
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.sent = deque()
+        self.blocked_until = 0.0
+
+    def delay(self, now):
+        """Seconds until a request may be sent (0 if one may be sent now)."""
+        while self.sent and self.sent[0] <= now - self.window:
+            self.sent.popleft()
+        window_delay = 0.0 if len(self.sent) < self.limit else self.sent[0] + self.window - now
+        return max(self.blocked_until - now, window_delay, 0.0)
+
+    def take(self, now):
+        self.sent.append(now)
+
+def parse_retry_after(response, now_epoch=None):
+    """
+    Returns how many seconds Cloudflare asked us to wait, from Retry-After
+    (seconds or HTTP date) or a "ratelimit" header with r=0;t=<seconds>.
+    Returns None if the response carries no such hint.
+    """
+    headers = getattr(response, "headers", None) or {}
+    retry_after = headers.get("Retry-After")
+    if retry_after:
+        if retry_after.strip().isdigit():
+            return float(retry_after)
+        from email.utils import parsedate_to_datetime
+        try:
+            return max(parsedate_to_datetime(retry_after).timestamp() - (now_epoch or time.time()), 0.0)
+        except (TypeError, ValueError):
+            pass
+    ratelimit = headers.get("ratelimit") or headers.get("RateLimit")
+    if ratelimit:
+        fields = dict(part.strip().split("=", 1) for part in ratelimit.split(";") if "=" in part)
+        if fields.get("r") == "0" and fields.get("t", "").isdigit():
+            return float(fields["t"])
+    return None
+
+class RequestScheduler:
+    """
+    Central gate for Cloudflare API calls. Owns one sliding window per API token,
+    lets queued updates go before verification reads, and pauses a token after
+    a 429 for as long as Retry-After (or the ratelimit header) asks.
+    """
+
+    PRIORITY_UPDATE = 0
+    PRIORITY_READ = 1
+
+    def __init__(self, requests_per_window, window_seconds, clock=time.monotonic):
+        self.requests_per_window = requests_per_window
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self.windows = {}
+        self.waiters = {}
+        self.throttled = 0
+        self.delayed = 0
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def _window(self, api_token):
+        if api_token not in self.windows:
+            self.windows[api_token] = SlidingWindowLimit(self.requests_per_window, self.window_seconds)
+        return self.windows[api_token]
+
+    def acquire(self, api_token, priority=PRIORITY_READ):
+        """Blocks until this request may be sent. Lower priority values go first."""
+        with self._cond:
+            entry = (priority, next(self._sequence))
+            queue = self.waiters.setdefault(api_token, [])
+            heapq.heappush(queue, entry)
+            waited = False
+            try:
+                while True:
+                    delay = None
+                    if queue[0] == entry:
+                        delay = self._window(api_token).delay(self.clock())
+                        if delay <= 0:
+                            self._window(api_token).take(self.clock())
+                            return
+                    if not waited:
+                        self.delayed += 1
+                        waited = True
+                    self._cond.wait(delay)
+            finally:
+                queue.remove(entry)
+                heapq.heapify(queue)
+                self._cond.notify_all()
+
+    def note_response(self, api_token, response):
+        """
+        Feeds a response back. On a 429 (or an exhausted ratelimit header) the
+        token is paused. Returns the pause in seconds, or None.
+        """
+        pause = parse_retry_after(response)
+        if response.status_code == 429:
+            self.throttled += 1
+            pause = 1.0 if pause is None else pause
+        if pause is None:
+            return None
+        with self._cond:
+            window = self._window(api_token)
+            window.blocked_until = max(window.blocked_until, self.clock() + pause)
+            self._cond.notify_all()
+        return pause
+
+    def queue_depth(self):
+        """Number of requests currently waiting for their turn."""
+        with self._cond:
+            return sum(len(queue) for queue in self.waiters.values())
+
+    def stats(self):
+        return {"queue_depth": self.queue_depth(), "throttled": self.throttled, "delayed": self.delayed}
+
+request_scheduler = RequestScheduler(cf_rate_limit, cf_rate_window)
+metrics.gauge("ddns_scheduler_queue_depth", request_scheduler.queue_depth)
+
+def cloudflare_request(method, url, cf_token, **kwargs):
+    """
+    Sends a Cloudflare API request through the RequestScheduler. Updates take
+    priority over reads, and 429 responses are retried after the requested
+    pause up to CFTHROTTLERETRIES times. The last response is returned.
+    """
+    priority = RequestScheduler.PRIORITY_READ if method == "GET" else RequestScheduler.PRIORITY_UPDATE
+    attempt = 0
+    while True:
+        request_scheduler.acquire(cf_token, priority)
+        request_start = time.perf_counter()
+        response = http_request(method, url, **kwargs)
+        metrics.observe("ddns_cloudflare_request_seconds", time.perf_counter() - request_start,
+                        {"method": method, "zone": zone_from_url(url)})
+        pause = request_scheduler.note_response(cf_token, response)
+        if response.status_code == 429:
+            metrics.inc("ddns_throttles_total", {"zone": zone_from_url(url)})
+        if response.status_code != 429 or attempt >= cf_throttle_retries:
+            return response
+        attempt += 1
+        log.warning(f"Cloudflare rate limit hit on {method} {url}. Retrying in {pause:.0f} seconds (attempt {attempt}/{cf_throttle_retries}).")
+
+def validate_ip_for_record_type(ip_text, record_type=None):
+    """
+    Returns ip_text normalized if it is an IP address of the family required by
+    record_type (IPv4 for A, IPv6 for AAAA, either otherwise), or None.
+    """
     try:
-        response = requests.get(url_to_fetch_ip, timeout=10)
+        ip_obj = ipaddress.ip_address(ip_text)
+    except ValueError:
+        return None
+    if record_type == "A" and ip_obj.version != 4:
+        return None
+    if record_type == "AAAA" and ip_obj.version != 6:
+        return None
+    return str(ip_obj)
+
+# Local wildcard addresses that pin a connection to one IP family
+FAMILY_SOURCE_ADDRESSES = {"A": ("0.0.0.0", 0), "AAAA": ("::", 0)}
+
+def get_public_ip(url_to_fetch_ip, record_type=None):
+    """
+    Fetches the public IP address from a given URL.
+    The reply must be a valid IP address matching record_type, if given.
+    With IPFAMILYBIND, the request leaves over the family of record_type.
+    """
+    source_address = FAMILY_SOURCE_ADDRESSES.get(record_type) if ip_family_bind else None
+    try:
+        response = http_request("GET", url_to_fetch_ip, source_address=source_address, timeout=10)
         response.raise_for_status()
-        ip_address = response.text.strip()
-        if not ip_address: # Basic validation for an IP-like string could be added here
-            print(f"[ERROR] IP address from {url_to_fetch_ip} is empty or invalid.")
+        ip_address = validate_ip_for_record_type(response.text.strip(), record_type)
+        if not ip_address:
+            log.error(f"IP address from {url_to_fetch_ip} is empty or invalid for record type {record_type or 'A/AAAA'}: '{response.text.strip()[:64]}'")
             return None
         return ip_address
-    except requests.exceptions.HTTPError as http_err:
-        print(f"[ERROR] HTTP error while fetching IP from {url_to_fetch_ip}: {http_err}")
+    except http_errors.HTTPError as http_err:
+        log.error(f"HTTP error while fetching IP from {url_to_fetch_ip}: {http_err}")
         return None
-    except requests.exceptions.RequestException as e:
-        print(f"[ERROR] Could not fetch IP from {url_to_fetch_ip}: {e}")
+    except http_errors.RequestException as e:
+        log.error(f"Could not fetch IP from {url_to_fetch_ip}: {e}")
         return None
     except Exception as e:
-        print(f"[ERROR] An unexpected error occurred in get_public_ip: {e}")
+        log.error(f"An unexpected error occurred in get_public_ip: {e}")
         return None
 
-def get_all_dns_records(cf_token, cf_zone_id):
-    """Fetches all DNS records for a given Cloudflare zone."""
+# Per-provider latency (EWMA, seconds) and success/failure counters
+ip_provider_stats = {}
+_ip_provider_stats_lock = threading.Lock()
+
+def record_ip_provider_result(url_to_fetch_ip, latency, succeeded):
+    """Updates the latency average and counters of an IP provider."""
+    with _ip_provider_stats_lock:
+        stats = ip_provider_stats.setdefault(url_to_fetch_ip, {"latency": None, "successes": 0, "failures": 0})
+        if succeeded:
+            stats["successes"] += 1
+            stats["latency"] = latency if stats["latency"] is None else 0.7 * stats["latency"] + 0.3 * latency
+        else:
+            stats["failures"] += 1
+
+def rank_ip_providers(urls):
+    """
+    Orders providers so the most reliable and fastest are raced first.
+    Providers without history keep their configured order ahead of failing ones.
+    """
+    def score(url_to_fetch_ip):
+        stats = ip_provider_stats.get(url_to_fetch_ip)
+        if not stats:
+            return (0.0, 0.0)
+        attempts = stats["successes"] + stats["failures"]
+        failure_ratio = stats["failures"] / attempts if attempts else 0.0
+        return (round(failure_ratio, 1), stats["latency"] or 0.0)
+    return sorted(urls, key=score)
+
+def _query_ip_provider(url_to_fetch_ip, record_type):
+    query_start = time.perf_counter()
+    ip_address = get_public_ip(url_to_fetch_ip, record_type)
+    latency = time.perf_counter() - query_start
+    record_ip_provider_result(url_to_fetch_ip, latency, ip_address is not None)
+    metrics.observe("ddns_ip_lookup_seconds", latency, {"provider": url_to_fetch_ip})
+    if ip_address is None:
+        metrics.inc("ddns_ip_lookup_failures_total", {"provider": url_to_fetch_ip})
+    return ip_address
+
+def detect_public_ip(urls, record_type=None, quorum=1, race_width=None):
+    """
+    Queries several IP providers in parallel and returns the public IP.
+    With quorum 1 the first valid reply wins; otherwise an address must be
+    reported by `quorum` providers. Returns None if no answer qualifies.
+    """
+    if len(urls) == 1:
+        return _query_ip_provider(urls[0], record_type)
+
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    votes = {}
+    executor = ThreadPoolExecutor(max_workers=min(race_width or len(urls), len(urls)))
+    try:
+        futures = [executor.submit(_query_ip_provider, u, record_type) for u in rank_ip_providers(urls)]
+        for future in as_completed(futures):
+            ip_address = future.result()
+            if not ip_address:
+                continue
+            votes[ip_address] = votes.get(ip_address, 0) + 1
+            if votes[ip_address] >= quorum:
+                return ip_address
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    log.error(f"No public IP reached a quorum of {quorum} across {len(urls)} provider(s). Votes: {votes or 'none'}")
+    return None
+
+def detect_public_ips(urls, record_types, quorum=1, race_width=None):
+    """
+    Detects the public IP of every record type (IP family) concurrently.
+    Yields (record_type, ip_or_None) pairs as each family's lookup completes.
+    """
+    if not record_types:
+        return
+    if len(record_types) == 1:
+        yield record_types[0], detect_public_ip(urls, record_types[0], quorum, race_width)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    with ThreadPoolExecutor(max_workers=len(record_types)) as executor:
+        futures = {executor.submit(detect_public_ip, urls, rt, quorum, race_width): rt for rt in record_types}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+class DNSRecordsFetchError(Exception):
+    """Raised by iter_dns_records when a page of DNS records cannot be fetched."""
+
+def get_dns_records_page(cf_token, cf_zone_id, params):
+    """
+    Fetches one page of DNS records for a zone.
+    Returns (records, result_info), or (None, None) if the request failed.
+    """
     headers = get_headers(cf_token)
-    print(f"[DEBUG] Requesting DNS records for Zone ID: {cf_zone_id}")
+    log.debug("Requesting DNS records for Zone ID: %s (page %s)", cf_zone_id, params.get("page", 1))
     try:
-        response = requests.get(
-            f"https://api.cloudflare.com/client/v4/zones/{cf_zone_id}/dns_records",
+        response = cloudflare_request(
+            "GET",
+            f"{cf_api_url}/zones/{cf_zone_id}/dns_records",
+            cf_token,
             headers=headers,
+            params=params,
             timeout=20
         )
         response.raise_for_status()
@@ -87,161 +928,1467 @@ def get_all_dns_records(cf_token, cf_zone_id):
         if response_data.get("success"):
             dns_records = response_data.get("result")
             if dns_records is None:
-                 print(f"[ERROR] Cloudflare API success true, but no 'result' field for DNS records in zone {cf_zone_id}.")
-                 return None
-            if not dns_records:
-                print(f"[INFO] No DNS records found in zone {cf_zone_id}.")
-            else:
-                print(f"[DEBUG] Successfully fetched {len(dns_records)} DNS records.")
-            return dns_records
+                 log.error(f"Cloudflare API success true, but no 'result' field for DNS records in zone {cf_zone_id}.")
+                 return None, None
+            return dns_records, response_data.get("result_info") or {}
         else:
-            print(f"[ERROR] Cloudflare API reported failure when fetching DNS records for zone {cf_zone_id}.")
-            print(f"  Errors: {response_data.get('errors')}")
-            print(f"  Messages: {response_data.get('messages')}")
-            return None
-    except requests.exceptions.HTTPError as http_err:
-        print(f"[ERROR] HTTP error fetching DNS records: {http_err}")
-        if hasattr(response, 'text'): print(f"  Response content: {response.text}")
-        return None
-    except requests.exceptions.RequestException as e:
-        print(f"[ERROR] Request exception fetching DNS records: {e}")
-        return None
+            log.error(f"Cloudflare API reported failure when fetching DNS records for zone {cf_zone_id}.")
+            log.error(f"  Errors: {response_data.get('errors')}")
+            log.error(f"  Messages: {response_data.get('messages')}")
+            return None, None
+    except http_errors.HTTPError as http_err:
+        log.error(f"HTTP error fetching DNS records: {http_err}")
+        if hasattr(response, 'text'): log.error(f"  Response content: {response.text}")
+        return None, None
+    except http_errors.RequestException as e:
+        log.error(f"Request exception fetching DNS records: {e}")
+        return None, None
     except Exception as e:
-        print(f"[ERROR] An unexpected error occurred in get_all_dns_records: {e}")
+        log.error(f"An unexpected error occurred in get_dns_records_page: {e}")
+        return None, None
+
+# Number of pages of each zone's full listing, learned from listings and
+# used to pick the cheapest way to read a few records (see fetch_live_records)
+zone_listing_pages = {}
+
+def iter_dns_records(cf_token, cf_zone_id, record_name=None, record_type=None,
+                     per_page=DNS_RECORDS_PER_PAGE, first_page=None):
+    """
+    Yields the DNS records of a zone, walking every page of the listing.
+    Pages are only requested as the caller consumes them, so a caller that
+    stops early skips the remaining pages. record_name/record_type are
+    applied as server-side filters. first_page, a (records, result_info) pair
+    already fetched for page 1, is used instead of requesting it again.
+    Raises DNSRecordsFetchError if a page cannot be fetched.
+    """
+    params = {"per_page": per_page}
+    if record_name:
+        params["name"] = record_name
+    if record_type:
+        params["type"] = record_type
+    full_listing = not record_name and not record_type and per_page == DNS_RECORDS_PER_PAGE
+    page = 1
+    while True:
+        params["page"] = page
+        if page == 1 and first_page is not None:
+            dns_records, result_info = first_page
+        else:
+            dns_records, result_info = get_dns_records_page(cf_token, cf_zone_id, params)
+        if dns_records is None:
+            raise DNSRecordsFetchError(f"Failed to fetch page {page} of DNS records for zone {cf_zone_id}.")
+        yield from dns_records
+        total_pages = result_info.get("total_pages")
+        if full_listing and total_pages:
+            zone_listing_pages[cf_zone_id] = total_pages
+        if total_pages is None:
+            # No pagination info: a short page is the last one.
+            if len(dns_records) < per_page:
+                return
+        elif page >= total_pages:
+            return
+        if not dns_records:
+            return
+        page += 1
+
+def get_all_dns_records(cf_token, cf_zone_id, record_name=None, record_type=None):
+    """
+    Fetches all DNS records for a given Cloudflare zone, optionally filtered
+    server-side by name and type. Returns a list, or None if the fetch failed.
+    """
+    try:
+        dns_records = list(iter_dns_records(cf_token, cf_zone_id, record_name, record_type))
+    except DNSRecordsFetchError as e:
+        log.error(f"{e}")
+        return None
+    if not dns_records:
+        log.info(f"No matching DNS records found in zone {cf_zone_id}.")
+    else:
+        log.debug(f"Successfully fetched {len(dns_records)} DNS records.")
+    return dns_records
+
+# Only the record fields this script reads are kept in a ZoneIndex
+INDEXED_RECORD_FIELDS = ("id", "name", "type", "content", "ttl", "proxied", "comment", "modified_on")
+
+class IndexedRecord(namedtuple("IndexedRecord", INDEXED_RECORD_FIELDS)):
+    """Compact, read-only DNS record supporting the dict-style .get() used by callers."""
+
+    __slots__ = ()
+
+    def get(self, field, default=None):
+        value = getattr(self, field, None)
+        return default if value is None else value
+
+class ZoneIndex:
+    """
+    DNS records of one fetch, indexed by ID and by (name, type).
+    Built once per fetch; every record lookup goes through it. Records are
+    stored as plain tuples of INDEXED_RECORD_FIELDS (which the garbage
+    collector stops tracking) and handed out as IndexedRecord.
+    """
+
+    __slots__ = ("by_id", "by_name_type")
+
+    def __init__(self, records=()):
+        self.by_id = {}
+        self.by_name_type = {}
+        self.extend(records)
+
+    def add(self, record):
+        self.extend((record,))
+
+    def extend(self, records):
+        """Indexes API record dicts (or IndexedRecords) in one pass."""
+        by_id = self.by_id
+        by_name_type = self.by_name_type
+        for record in records:
+            if isinstance(record, IndexedRecord):
+                compact = tuple(record)
+            else:
+                get = record.get
+                compact = (get("id"), get("name"), get("type"), get("content"),
+                           get("ttl"), get("proxied"), get("comment"), get("modified_on"))
+            by_id[compact[0]] = compact
+            key = (compact[1], compact[2])
+            same_key = by_name_type.get(key)
+            if same_key is None:
+                by_name_type[key] = [compact]
+            else:
+                same_key.append(compact)
+
+    def get(self, record_id):
+        """Returns the record with this ID, or None."""
+        compact = self.by_id.get(record_id)
+        return None if compact is None else IndexedRecord._make(compact)
+
+    def find(self, record_name, record_type):
+        """Returns the records with this name and type, in listing order."""
+        return [IndexedRecord._make(c) for c in self.by_name_type.get((record_name, record_type), ())]
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __iter__(self):
+        return map(IndexedRecord._make, self.by_id.values())
+
+def get_target_records(cf_token, cf_zone_id, wanted_keys):
+    """
+    Fetches only the records matching a set of (name, type) keys into a ZoneIndex.
+    A single key is filtered server-side; several keys are matched while
+    streaming the zone so memory stays flat regardless of zone size.
+    Returns None if the fetch failed.
+    """
+    if len(wanted_keys) == 1:
+        (record_name, record_type), = wanted_keys
+        dns_records = get_all_dns_records(cf_token, cf_zone_id, record_name, record_type)
+        return None if dns_records is None else ZoneIndex(dns_records)
+    index = ZoneIndex()
+    try:
+        for r in iter_dns_records(cf_token, cf_zone_id):
+            if (r.get('name'), r.get('type')) in wanted_keys:
+                index.add(r)
+    except DNSRecordsFetchError as e:
+        log.error(f"{e}")
         return None
+    log.debug(f"Found {len(index)} DNS records matching {len(wanted_keys)} target(s) in zone {cf_zone_id}.")
+    return index
 
 def find_record_details_by_name_and_type(dns_records_list, target_name, target_type, selected_idx_str=None):
     """
-    Finds a specific DNS record ID and name from a list based on name and type.
+    Finds a specific DNS record ID and name based on name and type.
+    dns_records_list may be a ZoneIndex or a plain list of records (indexed here).
     """
     if dns_records_list is None:
-        print("[ERROR] Cannot search for record: DNS records list is None (fetch failed).")
+        log.error("Cannot search for record: DNS records list is None (fetch failed).")
         return None, None
     if not dns_records_list:
-        print("[DEBUG] No DNS records provided to search in find_record_details_by_name_and_type.")
+        log.debug("No DNS records provided to search in find_record_details_by_name_and_type.")
         return None, None
 
     if not target_name:
-        print("[ERROR] Target record name must be provided to find a record automatically.")
+        log.error("Target record name must be provided to find a record automatically.")
         return None, None
     
-    print(f"[INFO] Searching for DNS record: Name='{target_name}', Type='{target_type}'")
-    matches = [
-        r for r in dns_records_list
-        if r.get('name') == target_name and r.get('type') == target_type
-    ]
+    log.info(f"Searching for DNS record: Name='{target_name}', Type='{target_type}'")
+    index = dns_records_list if isinstance(dns_records_list, ZoneIndex) else ZoneIndex(dns_records_list)
+    matches = index.find(target_name, target_type)
 
     if not matches:
-        print(f"[ERROR] No DNS record found with Name='{target_name}' and Type='{target_type}'.")
+        log.error(f"No DNS record found with Name='{target_name}' and Type='{target_type}'.")
         return None, None
 
     if len(matches) == 1:
         record = matches[0]
-        print(f"[SUCCESS] Found unique DNS record: Name='{record.get('name')}', Type='{record.get('type')}', ID='{record.get('id')}'")
+        log.info(f"Found unique DNS record: Name='{record.get('name')}', Type='{record.get('type')}', ID='{record.get('id')}'")
         return record.get('id'), record.get('name')
     else: # Multiple matches
-        print(f"[WARN] Multiple DNS records found for Name='{target_name}', Type='{target_type}':")
+        log.warning(f"Multiple DNS records found for Name='{target_name}', Type='{target_type}':")
         for i, r_val in enumerate(matches):
-            print(f"  Match {i}: ID='{r_val.get('id')}', Name='{r_val.get('name')}', Type='{r_val.get('type')}', Content='{r_val.get('content')}'")
+            log.warning(f"  Match {i}: ID='{r_val.get('id')}', Name='{r_val.get('name')}', Type='{r_val.get('type')}', Content='{r_val.get('content')}'")
         
         if selected_idx_str is not None:
             try:
                 idx = int(selected_idx_str)
                 if 0 <= idx < len(matches):
                     selected_record = matches[idx]
-                    print(f"[INFO] Using record at index {idx} (SELECTEDITEM='{selected_idx_str}').")
+                    log.info(f"Using record at index {idx} (SELECTEDITEM='{selected_idx_str}').")
                     return selected_record.get('id'), selected_record.get('name')
                 else:
-                    print(f"[ERROR] SELECTEDITEM index {idx} is out of range for {len(matches)} matches.")
+                    log.error(f"SELECTEDITEM index {idx} is out of range for {len(matches)} matches.")
                     return None, None
             except ValueError:
-                print(f"[ERROR] SELECTEDITEM '{selected_idx_str}' is not a valid integer index.")
+                log.error(f"SELECTEDITEM '{selected_idx_str}' is not a valid integer index.")
                 return None, None
         else:
-            print("[ERROR] Ambiguous record. Provide RECORDID or use SELECTEDITEM to choose from multiple matches.")
+            log.error("Ambiguous record. Provide RECORDID or use SELECTEDITEM to choose from multiple matches.")
             return None, None
 
+def build_update_payload(new_ip_address, record_ttl_value, update_timestamp_str, changes=None):
+    """
+    Builds the fields sent to Cloudflare. changes (see record_drift) limits
+    the body to the fields that differ; without it content and TTL (if set) are sent.
+    The comment is stamped only when content changes and COMMENTPOLICY is "stamp".
+    """
+    if changes is not None:
+        data = dict(changes)
+    else:
+        data = {"content": new_ip_address}
+        if record_ttl_value is not None:
+            data["ttl"] = record_ttl_value
+    if "content" in data and comment_policy == "stamp":
+        data["comment"] = f"DDNS script update. IP set to {new_ip_address} at {update_timestamp_str}"
+    return data
+
 def main_update_dns(record_name_to_update, new_ip_address,
                     cf_token, cf_zone_id, cf_record_id,
-                    record_ttl_value, update_timestamp_str):
-    """Updates a specific DNS record on Cloudflare."""
-    print(f"[INFO] Preparing to update DNS record ID '{cf_record_id}' for '{record_name_to_update}' to IP '{new_ip_address}'.")
+                    record_ttl_value, update_timestamp_str, changes=None, http_timeout=30):
+    """Updates a specific DNS record on Cloudflare, sending only `changes` if given."""
+    log.info(f"Preparing to update DNS record ID '{cf_record_id}' for '{record_name_to_update}' to IP '{new_ip_address}'.")
     headers = get_headers(cf_token)
-    data = {
-        "content": new_ip_address,
-        "comment": f"DDNS script update. IP set to {new_ip_address} at {update_timestamp_str}",
-        "ttl": record_ttl_value
-    }
+    data = build_update_payload(new_ip_address, record_ttl_value, update_timestamp_str, changes)
     
-    print(f"[DEBUG] DNS Update Payload: {data}")
+    log.debug("DNS Update Payload: %s", data)
 
     try:
-        response = requests.patch(
-            f"https://api.cloudflare.com/client/v4/zones/{cf_zone_id}/dns_records/{cf_record_id}",
+        response = cloudflare_request(
+            "PATCH",
+            f"{cf_api_url}/zones/{cf_zone_id}/dns_records/{cf_record_id}",
+            cf_token,
             headers=headers,
             json=data,
-            timeout=30
+            timeout=http_timeout
         )
         response.raise_for_status()
         
         response_data = response.json()
-        print("[DEBUG] DNS update API call processed.")
+        log.debug("DNS update API call processed.")
 
         if response_data.get("success"):
             updated_record_details = response_data.get("result", {})
-            print(f"[SUCCESS] Successfully updated DNS record for '{record_name_to_update}'.")
-            print(f"  Record ID: {updated_record_details.get('id')}")
-            print(f"  New IP:    {updated_record_details.get('content')}")
-            print(f"  Comment:   '{updated_record_details.get('comment')}'")
+            log.info(f"Successfully updated DNS record for '{record_name_to_update}'.")
+            log.debug(f"  Record ID: {updated_record_details.get('id')}")
+            log.debug(f"  New IP:    {updated_record_details.get('content')}")
+            log.debug(f"  Comment:   '{updated_record_details.get('comment')}'")
             return True
         else:
-            print(f"[ERROR] Cloudflare API reported failure for DNS update of '{record_name_to_update}'.")
-            print(f"  Errors: {response_data.get('errors')}")
-            print(f"  Messages: {response_data.get('messages')}")
+            log.error(f"Cloudflare API reported failure for DNS update of '{record_name_to_update}'.")
+            log.error(f"  Errors: {response_data.get('errors')}")
+            log.error(f"  Messages: {response_data.get('messages')}")
             return False
-    except requests.exceptions.HTTPError as http_err:
-        print(f"[ERROR] HTTP error during DNS update for '{record_name_to_update}': {http_err}")
-        if hasattr(response, 'text'): print(f"  Response content: {response.text}")
-    except requests.exceptions.ConnectionError as conn_err:
-        print(f"[ERROR] Connection error during DNS update for '{record_name_to_update}': {conn_err}")
-    except requests.exceptions.Timeout as timeout_err:
-        print(f"[ERROR] Timeout during DNS update for '{record_name_to_update}': {timeout_err}")
-    except requests.exceptions.RequestException as req_err:
-        print(f"[ERROR] General error during DNS update for '{record_name_to_update}': {req_err}")
+    except http_errors.HTTPError as http_err:
+        log.error(f"HTTP error during DNS update for '{record_name_to_update}': {http_err}")
+        if hasattr(response, 'text'): log.error(f"  Response content: {response.text}")
+    except http_errors.ConnectionError as conn_err:
+        log.error(f"Connection error during DNS update for '{record_name_to_update}': {conn_err}")
+    except http_errors.Timeout as timeout_err:
+        log.error(f"Timeout during DNS update for '{record_name_to_update}': {timeout_err}")
+    except http_errors.RequestException as req_err:
+        log.error(f"General error during DNS update for '{record_name_to_update}': {req_err}")
     except Exception as e:
-        print(f"[ERROR] An unexpected error occurred in main_update_dns: {e}")
+        log.error(f"An unexpected error occurred in main_update_dns: {e}")
     return False
 
+def batch_update_dns(cf_token, cf_zone_id, updates, record_ttl_value, update_timestamp_str, http_timeout=60):
+    """
+    Updates several records of one zone with a single call to the batch endpoint.
+    updates is a list of (record_id, new_ip_address[, changes]) tuples.
+    Returns {record_id: success} for every record, or None if the batch was
+    rejected as a whole and the caller should fall back to per-record updates.
+    """
+    headers = get_headers(cf_token)
+    patches = [dict(build_update_payload(new_ip, record_ttl_value, update_timestamp_str, changes[0] if changes else None),
+                    id=record_id)
+               for record_id, new_ip, *changes in updates]
+    log.info(f"Sending batch update of {len(patches)} record(s) in zone {cf_zone_id}.")
+    try:
+        response = cloudflare_request(
+            "POST",
+            f"{cf_api_url}/zones/{cf_zone_id}/dns_records/batch",
+            cf_token,
+            headers=headers,
+            json={"patches": patches},
+            timeout=http_timeout
+        )
+        response.raise_for_status()
+        response_data = response.json()
+        if not response_data.get("success"):
+            log.error(f"Cloudflare API rejected batch update for zone {cf_zone_id}.")
+            log.error(f"  Errors: {response_data.get('errors')}")
+            log.error(f"  Messages: {response_data.get('messages')}")
+            return None
+        wanted = {u[0]: u[1] for u in updates}
+        applied = {
+            r.get("id") for r in (response_data.get("result") or {}).get("patches") or []
+            if r.get("id") in wanted and r.get("content") == wanted[r.get("id")]
+        }
+        outcome = {record_id: record_id in applied for record_id in wanted}
+        if not all(outcome.values()):
+            log.warning(f"Batch update in zone {cf_zone_id} did not confirm {list(outcome.values()).count(False)} record(s).")
+        return outcome
+    except http_errors.HTTPError as http_err:
+        log.error(f"HTTP error during batch update for zone {cf_zone_id}: {http_err}")
+        if hasattr(response, 'text'): log.error(f"  Response content: {response.text}")
+    except http_errors.RequestException as req_err:
+        log.error(f"Error during batch update for zone {cf_zone_id}: {req_err}")
+    except Exception as e:
+        log.error(f"An unexpected error occurred in batch_update_dns: {e}")
+    return None
+
+def get_dns_record(cf_token, cf_zone_id, cf_record_id):
+    """
+    Fetches a single DNS record by ID.
+    Returns the record, False if it does not exist, or None if the request failed.
+    """
+    headers = get_headers(cf_token)
+    try:
+        response = cloudflare_request(
+            "GET",
+            f"{cf_api_url}/zones/{cf_zone_id}/dns_records/{cf_record_id}",
+            cf_token,
+            headers=headers,
+            timeout=20
+        )
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        response_data = response.json()
+        if response_data.get("success"):
+            return response_data.get("result") or False
+        log.error(f"Cloudflare API reported failure when fetching DNS record {cf_record_id}.")
+        log.error(f"  Errors: {response_data.get('errors')}")
+        return None
+    except http_errors.HTTPError as http_err:
+        log.error(f"HTTP error fetching DNS record {cf_record_id}: {http_err}")
+        return None
+    except http_errors.RequestException as e:
+        log.error(f"Request exception fetching DNS record {cf_record_id}: {e}")
+        return None
+    except Exception as e:
+        log.error(f"An unexpected error occurred in get_dns_record: {e}")
+        return None
+
+# --- State Cache ---
+# STATEFILE maps "zone|name-or-id|type" keys to the last resolved record:
+# {"record_id", "name", "type", "content", "modified_on", "updated_at"}.
+# modified_on is Cloudflare's last-modified stamp and acts as an ETag.
+
+_state_cache = None
+_state_dirty = False
+
+def make_state_key(cf_zone_id, record_ref, record_type):
+    """Builds the state file key for a target (record_ref is its name or record ID)."""
+    return f"{cf_zone_id}|{record_ref}|{record_type}"
+
+def load_state(path):
+    """Reads the state file. A missing or unreadable file yields an empty state."""
+    try:
+        with open(path) as f:
+            state = json.load(f)
+        if isinstance(state, dict) and isinstance(state.get("records"), dict):
+            return state
+        log.warning(f"State file '{path}' has an unexpected layout. Ignoring it.")
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        log.warning(f"Could not read state file '{path}': {e}. Ignoring it.")
+    return {"records": {}}
+
+def save_state(path, state):
+    """Writes the state file atomically (temporary file in the same directory, then rename)."""
+    import tempfile
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=".ddns-state-", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(state, f, indent=1, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError as e:
+        log.warning(f"Could not write state file '{path}': {e}")
+
+def get_state_cache():
+    """Returns the loaded state (empty and never saved if STATEFILE is not set)."""
+    global _state_cache
+    if _state_cache is None:
+        _state_cache = load_state(state_file) if state_file else {"records": {}}
+    return _state_cache
+
+def remember_target_state(target, modified_on=None):
+    """Stores a resolved target in the state; flush_state() writes it to the state file."""
+    global _state_dirty
+    if not state_file or not target.get("state_key"):
+        return
+    records = get_state_cache()["records"]
+    previous = records.get(target["state_key"], {})
+    records[target["state_key"]] = {
+        "record_id": target["record_id"],
+        "name": target["name"],
+        "type": target["type"],
+        "content": target["current_ip"],
+        "modified_on": modified_on or previous.get("modified_on"),
+        "updated_at": time.time(),
+    }
+    _state_dirty = True
+
+def flush_state():
+    """Writes the state file if any target was remembered since the last write."""
+    global _state_dirty
+    if _state_dirty:
+        _state_dirty = False
+        save_state(state_file, get_state_cache())
+
+def validate_cached_record(cf_token, cf_zone_id, key):
+    """
+    Validates a cached record with a single-record GET instead of listing the zone.
+    Returns the live record if it still exists with the cached name and type, else None.
+    """
+    cached = get_state_cache()["records"].get(key)
+    if not cached:
+        return None
+    return check_cached_record(cached, get_dns_record(cf_token, cf_zone_id, cached.get("record_id")))
+
+def check_cached_record(cached, record):
+    """
+    Compares a state file entry with the live record read for its ID (False or
+    None if it is gone or could not be read). Returns the live record if it
+    still has the cached name and type, else None.
+    """
+    if not record:
+        log.warning(f"Cached record ID '{cached.get('record_id')}' for '{cached.get('name')}' is no longer valid. Resolving again.")
+        return None
+    if record.get("name") != cached.get("name") or record.get("type") != cached.get("type"):
+        log.warning(f"Cached record ID '{record.get('id')}' now belongs to '{record.get('name')}' ({record.get('type')}). Resolving again.")
+        return None
+    if record.get("modified_on") and record.get("modified_on") == cached.get("modified_on"):
+        log.info(f"Cached record '{record.get('name')}' is unchanged since {record.get('modified_on')}.")
+    else:
+        log.info(f"Cached record '{record.get('name')}' was modified on Cloudflare; using its live content.")
+    return record
+
+def parse_targets(targets_str, default_zone_id=None, default_record_type="A"):
+    """
+    Parses a TARGETS string into a list of target dicts.
+    Entries are separated by commas or newlines and look like ZONEID:NAME[:TYPE].
+    ZONEID may be left empty (":NAME") to use the default zone. Entries without
+    TYPE get every type of default_record_type (a string or a list like ["A", "AAAA"]).
+    """
+    if isinstance(default_record_type, str):
+        default_record_type = [default_record_type]
+    targets = []
+    seen = set()
+    for raw_entry in targets_str.replace("\n", ",").split(","):
+        entry = raw_entry.strip()
+        if not entry:
+            continue
+        parts = [p.strip() for p in entry.split(":")]
+        if len(parts) not in (2, 3):
+            log.error(f"Invalid TARGETS entry '{entry}'. Expected ZONEID:NAME[:TYPE].")
+            continue
+        target_zone_id = parts[0] or default_zone_id
+        target_name = parts[1]
+        entry_types = [parts[2]] if len(parts) == 3 and parts[2] else default_record_type
+        if not target_zone_id or not target_name:
+            log.error(f"TARGETS entry '{entry}' is missing a zone ID or record name.")
+            continue
+        for target_type in entry_types:
+            key = (target_zone_id, target_name, target_type.upper())
+            if key in seen:
+                log.warning(f"Duplicate TARGETS entry '{entry}' ({key[2]}) ignored.")
+                continue
+            seen.add(key)
+            targets.append({"zone_id": target_zone_id, "name": target_name, "type": key[2]})
+    return targets
+
+def resolve_targets(targets, cf_token, selected_idx_str=None, zone_listings=None):
+    """
+    Resolves record IDs and current content for a list of targets.
+    Each zone is fetched once, no matter how many targets it holds.
+    zone_listings ({zone_id: records, or None if the fetch failed}) supplies
+    listings already fetched, e.g. by the async engine; those zones are not read again.
+    Returns the list of resolved targets; unresolved ones are reported and dropped.
+    """
+    zone_listings = zone_listings or {}
+    resolved = []
+    targets_by_zone = {}
+    cached_by_zone = {}
+    state_records = get_state_cache()["records"]
+    for target in targets:
+        key = make_state_key(target["zone_id"], target["name"], target["type"])
+        if key in state_records:
+            cached_by_zone.setdefault(target["zone_id"], []).append((target, key, state_records[key]))
+        else:
+            targets_by_zone.setdefault(target["zone_id"], []).append(target)
+
+    # Cached targets of a zone are validated together with the cheapest read
+    for target_zone_id, zone_cached in cached_by_zone.items():
+        if target_zone_id in zone_listings:
+            listing = zone_listings[target_zone_id]
+            live = None if listing is None else {r.get("id"): r for r in listing}
+        else:
+            live = fetch_live_records(cf_token, target_zone_id, [cached.get("record_id") for _, _, cached in zone_cached])
+        for target, key, cached in zone_cached:
+            cached_record = None
+            if live is not None:
+                cached_record = check_cached_record(cached, live.get(cached.get("record_id"), False))
+            if not cached_record or not cached_record.get("content"):
+                targets_by_zone.setdefault(target_zone_id, []).append(target)
+                continue
+            resolved.append({
+                "zone_id": target["zone_id"],
+                "name": cached_record.get("name"),
+                "type": target["type"],
+                "record_id": cached_record.get("id"),
+                "current_ip": cached_record.get("content"),
+                "ttl": cached_record.get("ttl"),
+                "proxied": cached_record.get("proxied"),
+                "state_key": key,
+            })
+            remember_target_state(resolved[-1], cached_record.get("modified_on"))
+
+    for target_zone_id, zone_targets in targets_by_zone.items():
+        log.info(f"Fetching DNS records for zone {target_zone_id} ({len(zone_targets)} target(s))...")
+        wanted_keys = {(t["name"], t["type"]) for t in zone_targets}
+        if target_zone_id in zone_listings:
+            listing = zone_listings[target_zone_id]
+            zone_records = None if listing is None else \
+                ZoneIndex(r for r in listing if (r.get("name"), r.get("type")) in wanted_keys)
+        else:
+            zone_records = get_target_records(cf_token, target_zone_id, wanted_keys)
+        if zone_records is None:
+            log.error(f"Failed to fetch DNS records for zone {target_zone_id}. Skipping its targets.")
+            continue
+        for target in zone_targets:
+            record_id, record_name = find_record_details_by_name_and_type(
+                zone_records, target["name"], target["type"], selected_idx_str
+            )
+            if not record_id:
+                log.error(f"Could not resolve target Name='{target['name']}', Type='{target['type']}' in zone {target_zone_id}.")
+                continue
+            record = zone_records.get(record_id)
+            if not record or not record.get("content"):
+                log.error(f"Target '{record_name}' has no current content. Skipping.")
+                continue
+            resolved.append({
+                "zone_id": target_zone_id,
+                "name": record_name,
+                "type": target["type"],
+                "record_id": record_id,
+                "current_ip": record.get("content"),
+                "ttl": record.get("ttl"),
+                "proxied": record.get("proxied"),
+                "state_key": make_state_key(target_zone_id, target["name"], target["type"]),
+            })
+            remember_target_state(resolved[-1], record.get("modified_on"))
+    flush_state()
+    return resolved
+
+# Target keys holding the last known value of each managed record field
+TARGET_FIELDS = {"content": "current_ip", "ttl": "ttl", "proxied": "proxied"}
+
+def desired_record_state(new_public_ip, record_ttl_value=None):
+    """Returns the record fields this script manages, as they should be."""
+    desired = {"content": new_public_ip}
+    if record_ttl_value is not None:
+        desired["ttl"] = record_ttl_value
+    if desired_proxied is not None:
+        desired["proxied"] = desired_proxied
+    return desired
+
+def record_drift(target, new_public_ip, record_ttl_value=None):
+    """
+    Returns the desired fields that differ from the target's last known record,
+    i.e. the minimal PATCH body. Fields whose actual value is unknown (None)
+    are not treated as drift, except content.
+    """
+    drift = {}
+    for field, value in desired_record_state(new_public_ip, record_ttl_value).items():
+        actual = target.get(TARGET_FIELDS[field])
+        if actual != value and (actual is not None or field == "content"):
+            drift[field] = value
+    return drift
+
+def fetch_live_records(cf_token, cf_zone_id, record_ids):
+    """
+    Reads the live records with the given IDs using the cheapest read: one
+    streamed zone listing when there are more IDs than listing pages,
+    otherwise a single-record GET per ID. If the zone's page count is not
+    known yet and there are more than SINGLE_READS_BEFORE_PROBE IDs, its
+    first page is fetched to learn it (and reused).
+    Returns {record_id: record} (deleted records are absent), or None on failure.
+    """
+    wanted = set(record_ids)
+    pages = zone_listing_pages.get(cf_zone_id)
+    first_page = None
+    if pages is None and len(wanted) > SINGLE_READS_BEFORE_PROBE:
+        first_page = get_dns_records_page(cf_token, cf_zone_id, {"per_page": DNS_RECORDS_PER_PAGE, "page": 1})
+        if first_page[0] is None:
+            return None
+        pages = first_page[1].get("total_pages") or 1
+        zone_listing_pages[cf_zone_id] = pages
+
+    if pages is not None and len(wanted) > pages:
+        found = {}
+        try:
+            for r in iter_dns_records(cf_token, cf_zone_id, first_page=first_page):
+                if r.get("id") in wanted:
+                    found[r.get("id")] = r
+        except DNSRecordsFetchError as e:
+            log.error(f"{e}")
+            return None
+        return found
+
+    found = {}
+    for record_id in wanted:
+        record = get_dns_record(cf_token, cf_zone_id, record_id)
+        if record is None:
+            return None
+        if record:
+            found[record_id] = record
+    return found
+
+def verify_targets(targets, cf_token):
+    """
+    Re-reads every target's record (see fetch_live_records) and refreshes its last known content, TTL
+    and proxy status, so edits made outside this script are reconciled by the
+    next update check. Returns the number of targets that had drifted.
+    """
+    drifted = 0
+    for cf_zone_id, zone_targets in group_targets_by_zone(targets).items():
+        live = fetch_live_records(cf_token, cf_zone_id, [t["record_id"] for t in zone_targets])
+        drifted += reconcile_live_records(cf_zone_id, zone_targets, live)
+    return drifted
+
+def group_targets_by_zone(targets):
+    """Returns {zone_id: [target, ...]} in target order."""
+    by_zone = {}
+    for target in targets:
+        by_zone.setdefault(target["zone_id"], []).append(target)
+    return by_zone
+
+def reconcile_live_records(cf_zone_id, zone_targets, live):
+    """
+    Refreshes the targets of one zone from their live records ({record_id: record},
+    or None if the read failed). Returns the number of targets that had drifted.
+    """
+    if live is None:
+        log.warning(f"Could not verify {len(zone_targets)} record(s) in zone {cf_zone_id}. Will retry next verification.")
+        return 0
+    drifted = 0
+    for target in zone_targets:
+        record = live.get(target["record_id"])
+        if record is None:
+            log.error(f"Record '{target['name']}' ({target['record_id']}) no longer exists in zone {cf_zone_id}.")
+            continue
+        changed_fields = {field: record.get(field) for field, key in TARGET_FIELDS.items()
+                          if record.get(field) != target.get(key)}
+        # Fields not known before are learned silently
+        external = {f: v for f, v in changed_fields.items() if target.get(TARGET_FIELDS[f]) is not None}
+        if external:
+            drifted += 1
+            log.warning("'%s' (%s) was changed outside this script: %s.", target["name"], target["type"],
+                        ", ".join(f"{f} {target.get(TARGET_FIELDS[f])!r} -> {v!r}" for f, v in external.items()),
+                        extra={"fields": {"event": "external_change", "record": target["name"], "type": target["type"]}})
+            metrics.inc("ddns_drift_detected_total", {"record": target["name"], "type": target["type"]})
+        for field, value in changed_fields.items():
+            target[TARGET_FIELDS[field]] = value
+        if "content" in changed_fields:
+            remember_target_state(target, record.get("modified_on"))
+    return drifted
+
+def qualify_record_name(record_name, domain=None):
+    """Returns the FQDN of a record name: "@" is the domain itself, other names get the domain appended."""
+    if record_name == "@":
+        return domain or record_name
+    if domain and record_name != domain and not record_name.endswith(f".{domain}"):
+        return f"{record_name}.{domain}"
+    return record_name
+
+def config_file_targets(sections, default_zone_id=None, default_record_type="A", default_domain=None):
+    """
+    Builds target dicts from config file sections. Each section names a record
+    (qualified with DOMAIN) and may set ZONEID, RECORDTYPE and DOMAIN, falling
+    back to the file's defaults and then to the given defaults.
+    """
+    if isinstance(default_record_type, str):
+        default_record_type = [default_record_type]
+    targets = []
+    for section_name, options in sections.items():
+        target_zone_id = options.get("ZONEID") or default_zone_id
+        if not target_zone_id:
+            log.error(f"Config section '{section_name}' has no ZoneId. Skipping it.")
+            continue
+        target_name = qualify_record_name(section_name, options.get("DOMAIN") or default_domain)
+        section_types = [t.strip().upper() for t in (options.get("RECORDTYPE") or "").split(",") if t.strip()]
+        for target_type in section_types or default_record_type:
+            targets.append({"zone_id": target_zone_id, "name": target_name, "type": target_type})
+    return targets
+
+class ConfigFileWatcher:
+    """
+    Reloads the target sections of CONFIGFILE when the file's mtime or size
+    changes and applies the difference to the running target list: removed
+    targets are dropped, new ones are resolved, and unchanged ones keep their
+    record IDs and state. base_targets (the TARGETS entries, or the record
+    set by NAME/DOMAIN/RECORDID) are always kept.
+    """
+
+    def __init__(self, path, base_targets=(), default_zone_id=None, default_record_type="A",
+                 default_domain=None):
+        self.path = path
+        self.base_targets = list(base_targets)
+        self.default_zone_id = default_zone_id
+        self.default_record_type = default_record_type
+        self.default_domain = default_domain
+        self.stamp = self._stamp()
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def desired_targets(self, sections):
+        """Returns the base targets and those of the given sections, without duplicates."""
+        targets = {}
+        file_targets = config_file_targets(sections, self.default_zone_id, self.default_record_type,
+                                           self.default_domain)
+        for target in self.base_targets + file_targets:
+            targets.setdefault(make_state_key(target["zone_id"], target["name"], target["type"]), target)
+        return list(targets.values())
+
+    def reload(self, targets):
+        """
+        Rereads the file if it changed. Returns (kept, added): the running targets
+        still wanted and the new, unresolved ones. Returns None if there is nothing to apply.
+        """
+        stamp = self._stamp()
+        if stamp == self.stamp:
+            return None
+        self.stamp = stamp
+        try:
+            _, sections = read_config_file(self.path)
+        except (OSError, ValueError) as e:
+            log.error(f"Could not reload config file '{self.path}': {e}. Keeping the current targets.")
+            return None
+        wanted = {make_state_key(t["zone_id"], t["name"], t["type"]): t for t in self.desired_targets(sections)}
+        kept = [t for t in targets if t["state_key"] in wanted]
+        kept_keys = {t["state_key"] for t in kept}
+        return kept, [t for key, t in wanted.items() if key not in kept_keys]
+
+    def apply(self, targets, kept, added, resolved):
+        """Replaces `targets` in place with the kept and newly resolved targets."""
+        log.info(f"Reloaded config file '{self.path}': {len(kept)} target(s) kept, {len(resolved)} added, "
+                 f"{len(targets) - len(kept)} removed.")
+        if len(resolved) < len(added):
+            log.warning(f"{len(added) - len(resolved)} new target(s) could not be resolved and will be ignored.")
+        targets[:] = kept + resolved
+
+    def refresh(self, targets, cf_token, selected_idx_str=None):
+        """Applies file changes to `targets` in place. Returns True if the file was reloaded."""
+        changes = self.reload(targets)
+        if changes is None:
+            return False
+        kept, added = changes
+        self.apply(targets, kept, added, resolve_targets(added, cf_token, selected_idx_str) if added else [])
+        return True
+
+# Set when running targets from CONFIGFILE; checked at the start of every cycle
+config_watcher = None
+
+def record_needs_update(target, new_public_ip, record_ttl_value=None):
+    """
+    Reports whether a resolved target differs from its desired state: the
+    public IP, and the configured TTL and proxy status when record_ttl_value is given.
+    """
+    current_dns_ip = target["current_ip"]
+    summary_key = ("unchanged", target["zone_id"], target["record_id"])
+    drift = record_drift(target, new_public_ip, record_ttl_value)
+    if not drift:
+        metrics.inc("ddns_update_skips_total", {"record": target["name"], "type": target["type"]})
+        repeats = log_summary.hit(summary_key)
+        log.log(logging.INFO if repeats else logging.DEBUG,
+                "'%s' (%s) already matches the public IP (%s) for %d consecutive check(s). No update needed.",
+                target["name"], target["type"], current_dns_ip, repeats or log_summary.counts[summary_key])
+        return False
+
+    log_summary.reset(summary_key)
+    if "content" not in drift:
+        log.warning("'%s' (%s) differs from its desired state: %s. Reconciling.",
+                    target["name"], target["type"], ", ".join(f"{k} -> {v}" for k, v in drift.items()),
+                    extra={"fields": {"event": "drift", "record": target["name"], "type": target["type"], "fields": drift}})
+        return True
+    log.warning("IP ADDRESS CHANGE DETECTED for '%s' (%s): DNS IP %s, new IP %s. Updating DNS record.",
+                target["name"], target["type"], current_dns_ip, new_public_ip,
+                extra={"fields": {"event": "ip_change", "record": target["name"], "type": target["type"],
+                                  "old_ip": current_dns_ip, "new_ip": new_public_ip}})
+    return True
+
+def apply_update_result(target, new_public_ip, update_successful, changes=None):
+    """Records the outcome of an update (of `changes`, if given) on the target. Returns update_successful."""
+    if update_successful:
+        log.info("DNS update for '%s' to '%s' was successful.", target["name"], new_public_ip,
+                 extra={"fields": {"event": "updated", "record": target["name"], "type": target["type"], "ip": new_public_ip}})
+        target["current_ip"] = new_public_ip
+        for field, value in (changes or {}).items():
+            target[TARGET_FIELDS[field]] = value
+        remember_target_state(target)
+        metrics.inc("ddns_updates_total", {"record": target["name"], "type": target["type"]})
+        return True
+    log.error(f"DNS update for '{target['name']}' failed. DNS IP '{target['current_ip']}' will be checked next cycle.")
+    metrics.inc("ddns_update_failures_total", {"record": target["name"], "type": target["type"]})
+    return False
+
+def report_ip_lookup(record_type, new_public_ip):
+    """Logs the outcome of a cycle's IP lookup, summarizing repeated failures. Returns True on success."""
+    summary_key = ("ip-lookup-failed", record_type)
+    if new_public_ip:
+        log_summary.reset(summary_key)
+        return True
+    repeats = log_summary.hit(summary_key)
+    log.log(logging.WARNING if repeats else logging.DEBUG,
+            "Failed to get new public IP for %s records (%d consecutive cycle(s)). Skipping update.",
+            record_type, repeats or log_summary.counts[summary_key])
+    return False
+
+def plan_updates(changed):
+    """
+    Splits (target, new_ip) pairs into batches per zone (at most BATCHSIZE
+    records each) and single updates. Without BATCHUPDATES everything is single.
+    """
+    if not batch_updates:
+        return [], list(changed)
+    by_zone = {}
+    for target, new_ip in changed:
+        by_zone.setdefault(target["zone_id"], []).append((target, new_ip))
+    batches, singles = [], []
+    for zone_items in by_zone.values():
+        if len(zone_items) < 2:
+            singles += zone_items
+            continue
+        batches += [zone_items[i:i + batch_size] for i in range(0, len(zone_items), batch_size)]
+    return batches, singles
+
+def run_batch(batch, cf_token, record_ttl_value, update_timestamp_str, http_timeout=60):
+    """
+    Sends one planned batch. Applies confirmed results and returns the
+    (target, new_ip) pairs that still need a per-record update.
+    """
+    cf_zone_id = batch[0][0]["zone_id"]
+    changes = [record_drift(t, ip, record_ttl_value) for t, ip in batch]
+    outcome = batch_update_dns(cf_token, cf_zone_id, [(t["record_id"], ip, c) for (t, ip), c in zip(batch, changes)],
+                               record_ttl_value, update_timestamp_str, http_timeout)
+    if outcome is None:
+        log.warning(f"Falling back to per-record updates for {len(batch)} record(s) in zone {cf_zone_id}.")
+        return list(batch)
+    leftovers = []
+    for (target, new_ip), target_changes in zip(batch, changes):
+        if outcome.get(target["record_id"]):
+            apply_update_result(target, new_ip, True, target_changes)
+        else:
+            leftovers.append((target, new_ip))
+    return leftovers
+
+def update_changed_records(changed, cf_token, record_ttl_value):
+    """
+    Publishes the new IP of every changed (target, new_ip) pair, batching per
+    zone when enabled. Returns the names of records that failed to update.
+    """
+    update_timestamp = get_current_timestamp()
+    batches, singles = plan_updates(changed)
+    for batch in batches:
+        singles += run_batch(batch, cf_token, record_ttl_value, update_timestamp)
+    failed = []
+    for target, new_ip in singles:
+        changes = record_drift(target, new_ip, record_ttl_value)
+        update_successful = main_update_dns(
+            target["name"], new_ip,
+            cf_token, target["zone_id"], target["record_id"],
+            record_ttl_value, update_timestamp, changes
+        )
+        if not apply_update_result(target, new_ip, update_successful, changes):
+            failed.append(target["name"])
+    return failed
+
+# Netlink constants (linux/rtnetlink.h) for interface address notifications
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+NLMSG_HEADER = struct.Struct("=IHHII")
+
+def netlink_has_address_change(data):
+    """Returns True if a netlink datagram holds an RTM_NEWADDR or RTM_DELADDR message."""
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(data):
+        msg_len, msg_type, _flags, _seq, _pid = NLMSG_HEADER.unpack_from(data, offset)
+        if msg_type in (RTM_NEWADDR, RTM_DELADDR):
+            return True
+        if msg_len < NLMSG_HEADER.size:
+            break
+        offset += (msg_len + 3) & ~3 # messages are 4-byte aligned
+    return False
+
+def open_netlink_address_socket():
+    """Opens a netlink socket subscribed to IPv4 and IPv6 address changes."""
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+    sock.bind((0, RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+    return sock
+
+def snapshot_local_addresses(proc_net="/proc/net"):
+    """
+    Returns the set of local interface addresses listed in /proc/net:
+    IPv4 host LOCAL entries from fib_trie and IPv6 entries from if_inet6.
+    """
+    addresses = set()
+    try:
+        with open(os.path.join(proc_net, "fib_trie")) as fib_trie:
+            previous = ""
+            for line in fib_trie:
+                if "/32 host LOCAL" in line:
+                    addresses.add(previous.strip().lstrip("|-+ "))
+                previous = line
+    except OSError:
+        pass
+    try:
+        with open(os.path.join(proc_net, "if_inet6")) as if_inet6:
+            for line in if_inet6:
+                fields = line.split()
+                if len(fields) >= 6:
+                    addresses.add(f"{fields[0]}%{fields[5]}")
+    except OSError:
+        pass
+    return addresses
+
+class AddressChangeWatcher:
+    """
+    Blocks between checks until a local address changes or the fallback
+    interval elapses. "netlink" listens for rtnetlink address events;
+    "poll" compares snapshots of /proc/net every poll_interval seconds.
+    """
+
+    # Address changes arrive in bursts; swallow follow-up events for this long
+    DEBOUNCE_SECONDS = 1.0
+
+    def __init__(self, mode, fallback_interval, poll_interval=5, sock=None, proc_net="/proc/net"):
+        self.mode = mode
+        self.fallback_interval = fallback_interval
+        self.poll_interval = poll_interval
+        self.proc_net = proc_net
+        self.sock = sock
+        if mode == "netlink" and sock is None:
+            try:
+                self.sock = open_netlink_address_socket()
+            except (OSError, AttributeError) as e:
+                log.warning(f"Could not open netlink socket ({e}). Falling back to polling /proc/net.")
+                self.mode = "poll"
+        self.last_snapshot = snapshot_local_addresses(proc_net) if self.mode == "poll" else None
+
+    def wait(self, timeout=None):
+        """
+        Returns True after a local address change, False when `timeout` seconds
+        (default: the fallback interval) elapsed.
+        """
+        deadline = time.monotonic() + (self.fallback_interval if timeout is None else timeout)
+        if self.mode == "netlink":
+            return self._wait_netlink(deadline)
+        return self._wait_poll(deadline)
+
+    def _wait_netlink(self, deadline):
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            readable, _, _ = select.select([self.sock], [], [], remaining)
+            if not readable:
+                continue
+            try:
+                data = self.sock.recv(65536)
+            except OSError as e:
+                # ENOBUFS: the kernel dropped events while addresses churned, so one may have changed
+                self._netlink_failed(e)
+                return True
+            if netlink_has_address_change(data):
+                self._drain_netlink()
+                return True
+
+    def _netlink_failed(self, error):
+        if error.errno == errno.ENOBUFS:
+            log.warning("Netlink address events were lost (receive buffer overrun). Checking the public IP.")
+            self._drain_netlink()
+            return
+        log.warning(f"Netlink socket failed ({error}). Falling back to polling /proc/net.")
+        self.mode = "poll"
+        self.last_snapshot = snapshot_local_addresses(self.proc_net)
+
+    def _drain_netlink(self):
+        while select.select([self.sock], [], [], self.DEBOUNCE_SECONDS)[0]:
+            try:
+                self.sock.recv(65536)
+            except OSError:
+                return
+
+    def _wait_poll(self, deadline):
+        while time.monotonic() < deadline:
+            time.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0)))
+            snapshot = snapshot_local_addresses(self.proc_net)
+            if snapshot != self.last_snapshot:
+                self.last_snapshot = snapshot
+                return True
+        return False
+
+class AdaptiveInterval:
+    """
+    Picks the wait before the next check. Each stable cycle multiplies the wait
+    by GROWTH up to max_interval; a change or failure resets it to
+    min_interval. Every wait is scaled by a random factor in [1 - jitter, 1 + jitter].
+    """
+
+    GROWTH = 1.5
+
+    def __init__(self, min_interval, max_interval, jitter=0.1, rng=random.random):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.jitter = jitter
+        self.rng = rng
+        self.current = min_interval
+
+    def next_delay(self, outcome):
+        """Returns the wait in seconds after a cycle whose outcome is "stable", "changed" or "failed"."""
+        if outcome == "stable":
+            self.current = min(self.current * self.GROWTH, self.max_interval)
+        else:
+            self.current = self.min_interval
+        return max(self.current * (1 + self.jitter * (2 * self.rng() - 1)), 1.0)
+
+def cycle_outcome(lookup_failed, changed_count, failed):
+    """Classifies a check cycle for AdaptiveInterval."""
+    if lookup_failed or failed:
+        return "failed"
+    return "changed" if changed_count else "stable"
+
+def watch_timeout(watcher, outcome, interval):
+    """
+    Seconds an AddressChangeWatcher waits after a cycle: the fallback interval,
+    or at most the update interval after a failed cycle so it is retried
+    without waiting for the next address change.
+    """
+    if outcome == "failed":
+        return min(interval, watcher.fallback_interval)
+    return watcher.fallback_interval
+
+def run_update_loop(targets, cf_token, ip_urls_to_fetch, record_ttl_value, interval):
+    """
+    Runs the DDNS update loop forever. The public IP is detected once per cycle
+    and record type and fanned out to every resolved target. IP families are
+    detected concurrently and each family's changes are published as soon as
+    its lookup completes.
+    """
+    watcher = None
+    if watch_mode != "off":
+        watcher = AddressChangeWatcher(watch_mode, watch_fallback_interval, watch_poll_interval)
+    pacer = AdaptiveInterval(interval, interval_max, interval_jitter / 100)
+    loop_count = 0
+    throttled_seen = 0
+    log.info(f"Starting DDNS update loop for {len(targets)} record(s).")
+    while True:
+        loop_count += 1
+        iteration_start = time.perf_counter()
+        log.debug("--- DDNS Check Loop #%d ---", loop_count)
+        if config_watcher is not None:
+            config_watcher.refresh(targets, cf_token, selected_item_env)
+        if verify_every and loop_count % verify_every == 0:
+            verify_targets(targets, cf_token)
+
+        record_types = sorted({t["type"] for t in targets})
+        log.debug("Fetching new public IP for %s records from %s...", record_types, ip_urls_to_fetch)
+        failed = []
+        lookup_failed = False
+        changed_count = 0
+        for record_type, new_public_ip in detect_public_ips(ip_urls_to_fetch, record_types, ip_quorum, ip_race_width):
+            if not report_ip_lookup(record_type, new_public_ip):
+                lookup_failed = True
+                continue
+            changed = [(t, new_public_ip) for t in targets
+                       if t["type"] == record_type and record_needs_update(t, new_public_ip, record_ttl_value)]
+            changed_count += len(changed)
+            failed += update_changed_records(changed, cf_token, record_ttl_value)
+        if failed and len(targets) > 1:
+            log.warning(f"{len(failed)} of {len(targets)} record(s) failed to update this cycle: {', '.join(failed)}")
+        scheduler_stats = request_scheduler.stats()
+        if scheduler_stats["throttled"] > throttled_seen or scheduler_stats["queue_depth"]:
+            log.info("Cloudflare API scheduler: queue depth %d, %d throttled response(s) so far.",
+                     scheduler_stats["queue_depth"], scheduler_stats["throttled"])
+        throttled_seen = scheduler_stats["throttled"]
+        metrics.observe("ddns_loop_iteration_seconds", time.perf_counter() - iteration_start)
+        flush_state()
+
+        outcome = cycle_outcome(lookup_failed, changed_count, failed)
+        if watcher is None:
+            delay = pacer.next_delay(outcome)
+            log.debug("Waiting for %.0f seconds before next check...", delay)
+            time.sleep(delay)
+        else:
+            timeout = watch_timeout(watcher, outcome, interval)
+            log.debug("Waiting for a local address change (%s, fallback check in %d seconds)...", watcher.mode, timeout)
+            if watcher.wait(timeout):
+                log.info("Local address change detected.")
+
+# --- Asyncio Engine ---
+# The HTTP layer is blocking, so each call runs in a worker thread under a
+# per-task timeout while the event loop drives many records concurrently.
+
+async def async_get_public_ip(url_to_fetch_ip, record_type=None, timeout=None):
+    """
+    Async equivalent of get_public_ip. Returns None on timeout; the abandoned
+    lookup still records the provider's result when it ends.
+    """
+    try:
+        return await asyncio.wait_for(
+            asyncio.to_thread(_query_ip_provider, url_to_fetch_ip, record_type),
+            timeout or async_task_timeout,
+        )
+    except asyncio.TimeoutError:
+        log.error(f"Timed out fetching IP from {url_to_fetch_ip}.")
+        return None
+
+async def async_detect_public_ip(urls, record_type=None, quorum=1, race_width=None):
+    """
+    Async equivalent of detect_public_ip: providers race in the event loop,
+    at most race_width at a time, the next ranked one starting as one finishes.
+    """
+    waiting = rank_ip_providers(urls)
+    width = min(race_width or len(urls), len(urls))
+    running = set()
+    votes = {}
+    try:
+        while waiting or running:
+            while waiting and len(running) < width:
+                running.add(asyncio.create_task(async_get_public_ip(waiting.pop(0), record_type)))
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                ip_address = task.result()
+                if not ip_address:
+                    continue
+                votes[ip_address] = votes.get(ip_address, 0) + 1
+                if votes[ip_address] >= quorum:
+                    return ip_address
+    finally:
+        for task in running:
+            task.cancel()
+    log.error(f"No public IP reached a quorum of {quorum} across {len(urls)} provider(s). Votes: {votes or 'none'}")
+    return None
+
+async def async_get_all_dns_records(cf_token, cf_zone_id, record_name=None, record_type=None, timeout=None):
+    """Async equivalent of get_all_dns_records. Returns None on failure or timeout."""
+    try:
+        return await run_in_worker(None, timeout or async_task_timeout, get_all_dns_records,
+                                   cf_token, cf_zone_id, record_name, record_type)
+    except asyncio.TimeoutError:
+        log.error(f"Timed out fetching DNS records for zone {cf_zone_id}.")
+        return None
+
+async def async_fetch_live_records(cf_token, cf_zone_id, record_ids):
+    """
+    Async equivalent of fetch_live_records: when a zone listing is the cheaper
+    read it is fetched with async_get_all_dns_records.
+    """
+    wanted = set(record_ids)
+    pages = zone_listing_pages.get(cf_zone_id)
+    if len(wanted) > (SINGLE_READS_BEFORE_PROBE if pages is None else pages):
+        dns_records = await async_get_all_dns_records(cf_token, cf_zone_id)
+        return None if dns_records is None else {r.get("id"): r for r in dns_records if r.get("id") in wanted}
+    return await asyncio.to_thread(fetch_live_records, cf_token, cf_zone_id, wanted)
+
+async def async_verify_targets(targets, cf_token):
+    """Async equivalent of verify_targets: the zones are read concurrently."""
+    by_zone = group_targets_by_zone(targets)
+    lives = await asyncio.gather(*(async_fetch_live_records(cf_token, cf_zone_id, [t["record_id"] for t in zone_targets])
+                                   for cf_zone_id, zone_targets in by_zone.items()))
+    return sum(reconcile_live_records(cf_zone_id, zone_targets, live)
+               for (cf_zone_id, zone_targets), live in zip(by_zone.items(), lives))
+
+async def async_refresh_config(watcher, targets, cf_token, selected_idx_str=None):
+    """
+    Async equivalent of ConfigFileWatcher.refresh: the zones of added targets
+    are listed concurrently (filtered server-side when a zone has one new
+    target) and the targets resolved from those listings.
+    """
+    changes = watcher.reload(targets)
+    if changes is None:
+        return False
+    kept, added = changes
+    by_zone = group_targets_by_zone(added)
+
+    async def list_zone(cf_zone_id, zone_targets):
+        keys = {(t["name"], t["type"]) for t in zone_targets}
+        if len(keys) == 1:
+            (record_name, record_type), = keys
+            return await async_get_all_dns_records(cf_token, cf_zone_id, record_name, record_type)
+        return await async_get_all_dns_records(cf_token, cf_zone_id)
+
+    listings = await asyncio.gather(*(list_zone(z, zone_targets) for z, zone_targets in by_zone.items()))
+    resolved = resolve_targets(added, cf_token, selected_idx_str, dict(zip(by_zone, listings))) if added else []
+    watcher.apply(targets, kept, added, resolved)
+    return True
+
+async def start_in_worker(semaphore, func, *args):
+    """
+    Starts func(*args) in a worker thread once the semaphore (if any) has a
+    free slot. Returns its future; the slot is released when the thread finishes.
+    """
+    if semaphore is not None:
+        await semaphore.acquire()
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+
+    def finished(done):
+        if semaphore is not None:
+            semaphore.release()
+        if not done.cancelled():
+            done.exception() # retrieved so an abandoned failure is not reported as unhandled
+
+    future.add_done_callback(finished)
+    return future
+
+async def run_in_worker(semaphore, timeout, func, *args):
+    """
+    Runs func(*args) in a worker thread and waits for it at most `timeout`
+    seconds (raising asyncio.TimeoutError). A thread cannot be cancelled, so a
+    semaphore slot stays taken until the thread has actually finished.
+    """
+    future = await start_in_worker(semaphore, func, *args)
+    return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+async def async_main_update_dns(record_name_to_update, new_ip_address,
+                                cf_token, cf_zone_id, cf_record_id,
+                                record_ttl_value, update_timestamp_str,
+                                semaphore=None, timeout=None, changes=None):
+    """
+    Async equivalent of main_update_dns. At most ASYNCWORKERS updates run at
+    once when a shared semaphore is given. The task timeout is also the
+    timeout of each HTTP attempt. Returns False on timeout, but the worker
+    stays taken until main_update_dns returns, which can take several times
+    longer: the request may queue in the scheduler, wait out Retry-After up
+    to CFTHROTTLERETRIES times and be retried up to HTTPRETRIES times.
+    """
+    timeout = timeout or async_task_timeout
+    try:
+        return await run_in_worker(semaphore, timeout, main_update_dns, record_name_to_update, new_ip_address,
+                                   cf_token, cf_zone_id, cf_record_id,
+                                   record_ttl_value, update_timestamp_str, changes, timeout)
+    except asyncio.TimeoutError:
+        log.error(f"Timed out updating DNS record '{record_name_to_update}'.")
+        return False
+
+async def async_update_changed_records(changed, cf_token, record_ttl_value, semaphore):
+    """
+    Async equivalent of update_changed_records: batches and single updates
+    run concurrently, bounded by the shared semaphore.
+    """
+    update_timestamp = get_current_timestamp()
+    batches, singles = plan_updates(changed)
+
+    async def send_batch(batch):
+        # A batch may land after the timeout, and run_batch applies its results
+        # to the targets, so its leftovers are only known once the thread ends
+        future = await start_in_worker(semaphore, run_batch, batch, cf_token,
+                                       record_ttl_value, update_timestamp, async_task_timeout)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), async_task_timeout)
+        except asyncio.TimeoutError:
+            log.warning(f"Batch update for zone {batch[0][0]['zone_id']} is taking longer than "
+                        f"{async_task_timeout} seconds. Waiting for its result before falling back.")
+            return await future
+
+    for leftovers in await asyncio.gather(*(send_batch(b) for b in batches)):
+        singles += leftovers
+    changes = [record_drift(t, ip, record_ttl_value) for t, ip in singles]
+    results = await asyncio.gather(*(
+        async_main_update_dns(t["name"], ip, cf_token, t["zone_id"], t["record_id"],
+                              record_ttl_value, update_timestamp, semaphore, changes=c)
+        for (t, ip), c in zip(singles, changes)
+    ))
+    return [t["name"] for (t, ip), ok, c in zip(singles, results, changes) if not apply_update_result(t, ip, ok, c)]
+
+async def run_async_update_loop(targets, cf_token, ip_urls_to_fetch, record_ttl_value, interval):
+    """
+    Asyncio equivalent of run_update_loop. Public IPs for every record type are
+    detected concurrently, and each family's changed records are updated as
+    soon as its lookup completes, through a worker pool bounded by ASYNCWORKERS.
+    """
+    semaphore = asyncio.Semaphore(async_workers)
+    watcher = None
+    if watch_mode != "off":
+        watcher = AddressChangeWatcher(watch_mode, watch_fallback_interval, watch_poll_interval)
+    pacer = AdaptiveInterval(interval, interval_max, interval_jitter / 100)
+    loop_count = 0
+    throttled_seen = 0
+    log.info(f"Starting async DDNS update loop for {len(targets)} record(s) ({async_workers} workers).")
+    while True:
+        loop_count += 1
+        iteration_start = time.perf_counter()
+        log.debug("--- DDNS Check Loop #%d ---", loop_count)
+        if config_watcher is not None:
+            await async_refresh_config(config_watcher, targets, cf_token, selected_item_env)
+        if verify_every and loop_count % verify_every == 0:
+            await async_verify_targets(targets, cf_token)
+
+        async def refresh_family(record_type):
+            """Returns (lookup_succeeded, changed_count, failed_names) for one record type."""
+            new_public_ip = await async_detect_public_ip(ip_urls_to_fetch, record_type, ip_quorum, ip_race_width)
+            if not report_ip_lookup(record_type, new_public_ip):
+                return False, 0, []
+            changed = [(t, new_public_ip) for t in targets
+                       if t["type"] == record_type and record_needs_update(t, new_public_ip, record_ttl_value)]
+            return True, len(changed), await async_update_changed_records(changed, cf_token, record_ttl_value, semaphore)
+
+        record_types = sorted({t["type"] for t in targets})
+        log.debug("Fetching new public IP for %s records from %s...", record_types, ip_urls_to_fetch)
+        results = await asyncio.gather(*(refresh_family(rt) for rt in record_types))
+        lookup_failed = not all(ok for ok, _, _ in results)
+        changed_count = sum(count for _, count, _ in results)
+        failed = sum((names for _, _, names in results), [])
+        if failed and len(targets) > 1:
+            log.warning(f"{len(failed)} of {len(targets)} record(s) failed to update this cycle: {', '.join(failed)}")
+        scheduler_stats = request_scheduler.stats()
+        if scheduler_stats["throttled"] > throttled_seen or scheduler_stats["queue_depth"]:
+            log.info("Cloudflare API scheduler: queue depth %d, %d throttled response(s) so far.",
+                     scheduler_stats["queue_depth"], scheduler_stats["throttled"])
+        throttled_seen = scheduler_stats["throttled"]
+        metrics.observe("ddns_loop_iteration_seconds", time.perf_counter() - iteration_start)
+        flush_state()
+
+        outcome = cycle_outcome(lookup_failed, changed_count, failed)
+        if watcher is None:
+            delay = pacer.next_delay(outcome)
+            log.debug("Waiting for %.0f seconds before next check...", delay)
+            await asyncio.sleep(delay)
+        else:
+            timeout = watch_timeout(watcher, outcome, interval)
+            log.debug("Waiting for a local address change (%s, fallback check in %d seconds)...", watcher.mode, timeout)
+            if await asyncio.to_thread(watcher.wait, timeout):
+                log.info("Local address change detected.")
+
+def run_engine(targets, cf_token, ip_urls_to_fetch, record_ttl_value, interval):
+    """Runs the update loop with the engine selected by ENGINE."""
+    if engine == "async":
+        global asyncio
+        import asyncio
+        asyncio.run(run_async_update_loop(targets, cf_token, ip_urls_to_fetch, record_ttl_value, interval))
+    else:
+        run_update_loop(targets, cf_token, ip_urls_to_fetch, record_ttl_value, interval)
+
+def run_fleet_mode(targets_str, cf_token, default_zone_id, default_record_type,
+                   ip_urls_to_fetch, record_ttl_value, interval, selected_idx_str=None):
+    """Resolves every TARGETS entry and runs one shared update loop for all of them."""
+    targets = parse_targets(targets_str, default_zone_id, default_record_type)
+    if not targets:
+        log.critical("TARGETS is set but contains no valid entries. Exiting.")
+        sys.exit(1)
+    log.info(f"Fleet mode: {len(targets)} target(s) across {len({t['zone_id'] for t in targets})} zone(s).")
+    run_targets(targets, cf_token, ip_urls_to_fetch, record_ttl_value, interval, selected_idx_str)
+
+def run_targets(targets, cf_token, ip_urls_to_fetch, record_ttl_value, interval, selected_idx_str=None):
+    """Resolves a list of target dicts and runs one shared update loop for all of them."""
+    setup_start_time = time.time()
+    resolved_targets = resolve_targets(targets, cf_token, selected_idx_str)
+    if not resolved_targets:
+        log.critical("None of the target records could be resolved. Exiting.")
+        sys.exit(1)
+
+    log.info("Target records identified:")
+    for t in resolved_targets:
+        log.info(f"  {t['name']} ({t['type']}) in zone {t['zone_id']}: ID={t['record_id']}, IP={t['current_ip']}")
+    if len(resolved_targets) < len(targets):
+        log.warning(f"{len(targets) - len(resolved_targets)} target(s) could not be resolved and will be ignored.")
+    log.info(f"Setup and record identification completed in {time.time() - setup_start_time:.2f} seconds using {http_request_count} HTTP request(s).")
+
+    run_engine(resolved_targets, cf_token, ip_urls_to_fetch, record_ttl_value, interval)
+
 # --- Main Script Execution ---
 if __name__ == "__main__":
     script_start_time = time.time()
     
-    print("\n" + "="*70)
-    print(f" Cloudflare Dynamic DNS Updater Script - Started at {get_current_timestamp()}")
-    print("="*70 + "\n")
-
-    print("--- Initial Configuration ---")
-    print(f"  Cloudflare Zone ID:       {zone_id or 'Not Set'}")
-    print(f"  Cloudflare Token:         {'Set' if token else 'Not Set'}")
-    print(f"  Domain/Zone (DOMAIN):     {domain_env or 'Not Set'}")
-    print(f"  Record Name (NAME):       {name_env or 'Not Set'}")
-    print(f"  Record Type (RECORDTYPE): {record_type_env}")
-    print(f"  Record ID (RECORDID):     {record_id_env or 'Not set, will attempt to find'}")
-    print(f"  Public IP URL (IPURL):    {ip_url}")
-    print(f"  Record TTL:               {ttl}")
-    print(f"  Update Interval:          {update_interval} seconds")
-    print(f"  Selected Item (SELECTEDITEM): {selected_item_env or 'Not set'}")
-    print("-----------------------------\n")
+    log.info(f"Cloudflare Dynamic DNS Updater Script - Started at {get_current_timestamp()}")
+
+    log.info("Initial configuration:")
+    log.info(f"  Cloudflare Zone ID:       {zone_id or 'Not Set'}")
+    log.info(f"  Cloudflare Token:         {'Set' if token else 'Not Set'}")
+    log.info(f"  Domain/Zone (DOMAIN):     {domain_env or 'Not Set'}")
+    log.info(f"  Record Name (NAME):       {name_env or 'Not Set'}")
+    log.info(f"  Record Type (RECORDTYPE): {', '.join(record_types)}")
+    log.info(f"  Record ID (RECORDID):     {record_id_env or 'Not set, will attempt to find'}")
+    log.info(f"  Public IP URL (IPURL):    {', '.join(ip_urls)}")
+    log.info(f"  IP Quorum (IPQUORUM):     {ip_quorum} of {len(ip_urls)}")
+    log.info(f"  Record TTL (TTL):         {ttl if ttl is not None else 'Not set, left unchanged'}")
+    log.info(f"  Update Interval:          {update_interval} seconds" + (f", stretching to {interval_max} while stable" if interval_max > update_interval else "") + f" (+/- {interval_jitter}% jitter)")
+    log.info(f"  Batch Updates (BATCHUPDATES): {'On, up to ' + str(batch_size) + ' records per request' if batch_updates else 'Off'}")
+    log.info(f"  Metrics (METRICSPORT):    {f'http://{metrics_addr}:{metrics_port}/metrics' if metrics_port else 'Off'}")
+    log.info(f"  HTTP Backend (HTTPBACKEND): {http_backend}")
+    log.info(f"  Engine (ENGINE):          {engine}" + (f" ({async_workers} workers)" if engine == "async" else ""))
+    log.info(f"  Watch Mode (WATCHMODE):   {watch_mode}" + (f" (fallback every {watch_fallback_interval} seconds)" if watch_mode != "off" else ""))
+    log.info(f"  Selected Item (SELECTEDITEM): {selected_item_env or 'Not set'}")
+    log.info(f"  State File (STATEFILE):   {state_file or 'Not set'}")
+    log.info(f"  Fleet Targets (TARGETS):  {'Set' if targets_env else 'Not set'}")
+    log.info(f"  Config File (CONFIGFILE): {config_file + f' ({len(config_sections)} target section(s))' if config_file else 'Not set'}")
+    log.info(f"  Logging (LOGLEVEL/LOGFORMAT): {logging.getLevelName(log.level)}, {log_format}")
+
+    if metrics_port:
+        start_metrics_server(metrics_port, metrics_addr)
+
+    if config_file_error:
+        log.critical(f"Could not read CONFIGFILE '{config_file}': {config_file_error}. Exiting.")
+        sys.exit(1)
+
+    if targets_env or config_sections:
+        if not token:
+            log.critical("Missing critical environment variable: TOKEN. Exiting.")
+            sys.exit(1)
+        if config_file:
+            env_targets = parse_targets(targets_env, zone_id, record_types) if targets_env else []
+            config_watcher = ConfigFileWatcher(config_file, env_targets, zone_id, record_types, domain_env)
+            file_targets = config_watcher.desired_targets(config_sections)
+            if not file_targets:
+                log.critical("TARGETS and CONFIGFILE contain no valid targets. Exiting.")
+                sys.exit(1)
+            log.info(f"Config file mode: {len(file_targets)} target(s) across {len({t['zone_id'] for t in file_targets})} zone(s), reloaded when '{config_file}' changes.")
+            run_targets(file_targets, token, ip_urls, ttl, update_interval, selected_item_env)
+        run_fleet_mode(targets_env, token, zone_id, record_types,
+                       ip_urls, ttl, update_interval, selected_item_env)
 
     # Critical Environment Variables Check
     required_vars_map = {"TOKEN": token, "ZONEID": zone_id}
     missing_critical_vars = [k for k, v in required_vars_map.items() if not v]
     if missing_critical_vars:
-        print(f"[FATAL] Missing critical environment variables: {', '.join(missing_critical_vars)}. Exiting.")
+        log.critical(f"Missing critical environment variables: {', '.join(missing_critical_vars)}. Exiting.")
         sys.exit(1)
 
     if not record_id_env and not name_env and not domain_env:
-        print("[FATAL] Must provide either RECORDID, or (NAME and/or DOMAIN). Exiting.")
+        log.critical("Must provide either RECORDID, or (NAME and/or DOMAIN). Exiting.")
         sys.exit(1)
 
     # Determine target record name (FQDN)
@@ -250,130 +2397,141 @@ if __name__ == "__main__":
         if name_env == "@":
             if domain_env:
                 target_record_name_fqdn = domain_env
-                print(f"[INFO] NAME is '@', targeting root domain: '{target_record_name_fqdn}'.")
+                log.info(f"NAME is '@', targeting root domain: '{target_record_name_fqdn}'.")
             else:
-                print("[FATAL] NAME is '@' but DOMAIN (zone name) is not set. Exiting.")
+                log.critical("NAME is '@' but DOMAIN (zone name) is not set. Exiting.")
                 sys.exit(1)
         elif domain_env:
             if not name_env.endswith(f".{domain_env}") and name_env != domain_env:
                 target_record_name_fqdn = f"{name_env}.{domain_env}"
-                print(f"[INFO] Constructed FQDN: '{target_record_name_fqdn}' from NAME='{name_env}' and DOMAIN='{domain_env}'.")
+                log.info(f"Constructed FQDN: '{target_record_name_fqdn}' from NAME='{name_env}' and DOMAIN='{domain_env}'.")
             else: 
                 target_record_name_fqdn = name_env
-                print(f"[INFO] Using NAME '{name_env}' as target (assumed FQDN or root).")
+                log.info(f"Using NAME '{name_env}' as target (assumed FQDN or root).")
         else: 
             target_record_name_fqdn = name_env
-            print(f"[INFO] DOMAIN not set. Using NAME '{name_env}' as target (must be FQDN).")
+            log.info(f"DOMAIN not set. Using NAME '{name_env}' as target (must be FQDN).")
     elif domain_env: 
         target_record_name_fqdn = domain_env
-        print(f"[INFO] NAME not set. Targeting root domain based on DOMAIN env: '{target_record_name_fqdn}'.")
+        log.info(f"NAME not set. Targeting root domain based on DOMAIN env: '{target_record_name_fqdn}'.")
     
     if not record_id_env and not target_record_name_fqdn:
-         print("[FATAL] Could not determine target record name. Set RECORDID, or NAME and/or DOMAIN. Exiting.")
+         log.critical("Could not determine target record name. Set RECORDID, or NAME and/or DOMAIN. Exiting.")
          sys.exit(1)
-    print("-" * 30)
+
+    # Dual-stack: one target per record type, sharing the update loop
+    if len(record_types) > 1:
+        if not target_record_name_fqdn:
+            log.critical(f"RECORDTYPE '{', '.join(record_types)}' needs NAME and/or DOMAIN to find each record. Exiting.")
+            sys.exit(1)
+        if record_id_env:
+            log.warning("RECORDID is ignored because RECORDTYPE lists several types. Finding each record by name.")
+        family_targets = [{"zone_id": zone_id, "name": target_record_name_fqdn, "type": rt} for rt in record_types]
+        if config_file:
+            # Sections added to the file later join these records
+            config_watcher = ConfigFileWatcher(config_file, family_targets, zone_id, record_types, domain_env)
+        run_targets(family_targets, token, ip_urls, ttl, update_interval, selected_item_env)
 
     # Determine final_record_id and final_name_for_update
     final_record_id_to_update = None
     final_name_for_update = None
     effective_record_type = record_type_env
 
-    print("[INFO] Fetching all DNS records for the zone...")
-    all_zone_records = get_all_dns_records(token, zone_id)
-    if all_zone_records is None:
-        print(f"[FATAL] Failed to fetch DNS records for zone {zone_id}. Cannot proceed. Exiting.")
-        sys.exit(1)
-
-    if record_id_env:
-        print(f"[INFO] Using provided RECORDID: {record_id_env} to identify target record.")
-        found_record_by_id = next((r for r in all_zone_records if r.get('id') == record_id_env), None)
+    current_dns_ip = None
+    current_modified_on = None
+    current_record = {}
+    single_state_key = make_state_key(zone_id, record_id_env or target_record_name_fqdn, record_type_env)
+    cached_record = validate_cached_record(token, zone_id, single_state_key)
+    if cached_record:
+        log.info(f"Using cached record ID '{cached_record.get('id')}' from state file '{state_file}'.")
+        final_record_id_to_update = cached_record.get('id')
+        final_name_for_update = cached_record.get('name')
+        effective_record_type = cached_record.get('type')
+        current_dns_ip = cached_record.get("content")
+        current_modified_on = cached_record.get("modified_on")
+        current_record = cached_record
+    elif record_id_env:
+        log.info(f"Using provided RECORDID: {record_id_env} to identify target record.")
+        found_record_by_id = get_dns_record(token, zone_id, record_id_env)
+        if found_record_by_id is None:
+            log.critical(f"Failed to fetch DNS record '{record_id_env}' in zone {zone_id}. Cannot proceed. Exiting.")
+            sys.exit(1)
         if found_record_by_id:
             actual_name = found_record_by_id.get('name')
             actual_type = found_record_by_id.get('type')
-            print(f"[SUCCESS] Record with ID '{record_id_env}' found: Name='{actual_name}', Type='{actual_type}'.")
+            log.info(f"Record with ID '{record_id_env}' found: Name='{actual_name}', Type='{actual_type}'.")
             
             final_record_id_to_update = record_id_env
             final_name_for_update = actual_name 
             effective_record_type = actual_type
+            current_dns_ip = found_record_by_id.get("content")
+            current_modified_on = found_record_by_id.get("modified_on")
+            current_record = found_record_by_id
 
             if target_record_name_fqdn and target_record_name_fqdn != actual_name:
-                print(f"[WARN] Env-derived name '{target_record_name_fqdn}' differs from actual name '{actual_name}' for RECORDID '{record_id_env}'. Using actual name: '{actual_name}'.")
+                log.warning(f"Env-derived name '{target_record_name_fqdn}' differs from actual name '{actual_name}' for RECORDID '{record_id_env}'. Using actual name: '{actual_name}'.")
             if record_type_env != actual_type:
-                 print(f"[WARN] Provided RECORDTYPE '{record_type_env}' differs from actual type '{actual_type}' for RECORDID '{record_id_env}'. Using actual type: '{actual_type}'.")
+                 log.warning(f"Provided RECORDTYPE '{record_type_env}' differs from actual type '{actual_type}' for RECORDID '{record_id_env}'. Using actual type: '{actual_type}'.")
         else:
-            print(f"[FATAL] RECORDID '{record_id_env}' provided, but no such record found in zone '{zone_id}'. Exiting.")
+            log.critical(f"RECORDID '{record_id_env}' provided, but no such record found in zone '{zone_id}'. Exiting.")
             sys.exit(1)
     else:
-        print(f"[INFO] RECORDID not provided. Finding record by Name='{target_record_name_fqdn}', Type='{record_type_env}'.")
+        log.info(f"RECORDID not provided. Finding record by Name='{target_record_name_fqdn}', Type='{record_type_env}'.")
         if not target_record_name_fqdn:
-            print("[FATAL] Target record name (target_record_name_fqdn) is not set. Cannot find record. Exiting.")
+            log.critical("Target record name (target_record_name_fqdn) is not set. Cannot find record. Exiting.")
+            sys.exit(1)
+
+        log.info("Fetching matching DNS records for the zone...")
+        matching_records = get_target_records(token, zone_id, {(target_record_name_fqdn, record_type_env)})
+        if matching_records is None:
+            log.critical(f"Failed to fetch DNS records for zone {zone_id}. Cannot proceed. Exiting.")
             sys.exit(1)
         
         final_record_id_to_update, retrieved_name = find_record_details_by_name_and_type(
-            all_zone_records, target_record_name_fqdn, record_type_env, selected_item_env
+            matching_records, target_record_name_fqdn, record_type_env, selected_item_env
         )
         if not final_record_id_to_update:
-            print(f"[FATAL] Could not automatically determine the record for Name='{target_record_name_fqdn}', Type='{record_type_env}'. Exiting.")
+            log.critical(f"Could not automatically determine the record for Name='{target_record_name_fqdn}', Type='{record_type_env}'. Exiting.")
             sys.exit(1)
         final_name_for_update = retrieved_name
+        matched_record = matching_records.get(final_record_id_to_update)
+        current_dns_ip = matched_record.get("content")
+        current_modified_on = matched_record.get("modified_on")
+        current_record = matched_record
     
     if not final_record_id_to_update or not final_name_for_update:
-        print("[FATAL] Could not determine final_record_id or final_name_for_update. Exiting before loop.")
+        log.critical("Could not determine final_record_id or final_name_for_update. Exiting before loop.")
         sys.exit(1)
 
-    current_dns_ip = next(
-        (r.get("content") for r in all_zone_records if r.get("id") == final_record_id_to_update),
-        None,
-    )
     if not current_dns_ip:
-        print("[FATAL] Target DNS record has no current content. Exiting before loop.")
+        log.critical("Target DNS record has no current content. Exiting before loop.")
         sys.exit(1)
 
-    print("\n" + "*"*20 + " Target Record Identified " + "*"*20)
-    print(f"  Record ID to Update: {final_record_id_to_update}")
-    print(f"  Record Name:         {final_name_for_update}")
-    print(f"  Record Type:         {effective_record_type}")
-    print(f"  Current DNS IP:      {current_dns_ip}")
-    print("*"* (40 + len(" Target Record Identified ")) + "\n")
+    log.info("Target record identified:")
+    log.info(f"  Record ID to Update: {final_record_id_to_update}")
+    log.info(f"  Record Name:         {final_name_for_update}")
+    log.info(f"  Record Type:         {effective_record_type}")
+    log.info(f"  Current DNS IP:      {current_dns_ip}")
     
     setup_end_time = time.time()
-    print(f"[INFO] Setup and record identification completed in {setup_end_time - script_start_time:.2f} seconds.")
+    log.info(f"Setup and record identification completed in {setup_end_time - script_start_time:.2f} seconds using {http_request_count} HTTP request(s).")
 
     # --- Main DDNS Update Loop ---
-    loop_count = 0
-    print("\n" + "="*70)
-    print(" Starting DDNS Update Loop...")
-    print("="*70)
-    while True:
-        loop_count += 1
-        current_loop_time = get_current_timestamp()
-        print(f"\n--- DDNS Check Loop #{loop_count} ({current_loop_time}) ---")
-        
-        print(f"[INFO] Current Cloudflare DNS IP: {current_dns_ip}")
-        print(f"[INFO] Fetching new public IP from {ip_url}...")
-        new_public_ip = get_public_ip(ip_url)
-        
-        if not new_public_ip:
-            print(f"[WARN] Failed to get new public IP in this loop cycle. Skipping update.")
-        elif new_public_ip == current_dns_ip:
-            print(f"[INFO] Cloudflare DNS already matches the public IP ({current_dns_ip}). No update needed.")
-        else:
-            print(f"[!!!!] IP ADDRESS CHANGE DETECTED [!!!!]")
-            print(f"  DNS IP: {current_dns_ip}")
-            print(f"  New IP: {new_public_ip}")
-            print(f"[INFO] Updating DNS record '{final_name_for_update}'...")
-            
-            update_timestamp = get_current_timestamp()
-            update_successful = main_update_dns(
-                final_name_for_update, new_public_ip,
-                token, zone_id, final_record_id_to_update,
-                ttl, update_timestamp
-            )
-            if update_successful:
-                print(f"[SUCCESS] DNS update for '{final_name_for_update}' to '{new_public_ip}' was successful.")
-                current_dns_ip = new_public_ip
-            else:
-                print(f"[ERROR] DNS update for '{final_name_for_update}' failed. DNS IP '{current_dns_ip}' will be checked next cycle.")
-
-        print(f"[INFO] Waiting for {update_interval} seconds before next check...")
-        time.sleep(update_interval)
+    target_record = {
+        "zone_id": zone_id,
+        "name": final_name_for_update,
+        "type": effective_record_type,
+        "record_id": final_record_id_to_update,
+        "current_ip": current_dns_ip,
+        "ttl": current_record.get("ttl"),
+        "proxied": current_record.get("proxied"),
+        "state_key": single_state_key,
+    }
+    remember_target_state(target_record, current_modified_on)
+    flush_state()
+    if config_file:
+        # Sections added to the file later join this record; its key matches single_state_key
+        config_watcher = ConfigFileWatcher(
+            config_file, [{"zone_id": zone_id, "name": record_id_env or target_record_name_fqdn, "type": record_type_env}],
+            zone_id, record_types, domain_env)
+    run_engine([target_record], token, ip_urls, ttl, update_interval)
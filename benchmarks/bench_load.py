@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Load benchmark: drives DDNS-update.py against the local Cloudflare stand-in.
+
+Starts benchmarks/mock_cloudflare.py in-process, points the script at it
+(CFAPIURL, IPURL) and runs three scenarios:
+
+- list:   get_all_dns_records over the whole zone, --list-runs times
+- update: --updates main_update_dns calls from --concurrency threads
+- loop:   --cycles cycles of run_update_loop over --targets records, with the
+          public IP changing every cycle so every target is updated
+
+Reported per scenario: operations per second, p50/p99 latency (per call for
+list and update, per cycle for loop), the requests the mock served (and how
+many were 429s or 5xx), and the script's own HTTP request count ("client"),
+which includes retries.
+
+Usage: python benchmarks/bench_load.py [--records N] [--latency MS] [--rate-limit N] [--error-rate F] ...
+"""
+
+import argparse
+import importlib.util
+import io
+import os
+import runpy
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from mock_cloudflare import API_PREFIX, add_mock_arguments, mock_from_arguments  # noqa: E402
+
+SCRIPT = Path(__file__).resolve().parent.parent / "DDNS-update.py"
+TOKEN = "bench-token"
+
+
+class CyclesDone(Exception):
+    pass
+
+
+def load_ddns(mock, args):
+    env = {
+        "TOKEN": TOKEN,
+        "CFAPIURL": mock.url + API_PREFIX,
+        "IPURL": mock.url + "/ip",
+        "HTTPBACKEND": args.backend,
+        "HTTPPOOLSIZE": str(max(args.concurrency, 10)),
+        "CFRATELIMIT": str(args.client_rate_limit),
+        "CFRATEWINDOW": "1",
+        "BATCHUPDATES": "true" if args.batch else "false",
+        "VERIFYEVERY": "0",
+        "LOGLEVEL": "ERROR",
+        "LOGASYNC": "false",
+    }
+    with patch.dict(os.environ, env, clear=True), redirect_stdout(io.StringIO()):
+        # run_path returns a copy; the functions' globals are the live namespace
+        return runpy.run_path(str(SCRIPT), run_name="ddns_bench")["http_request"].__globals__
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)] if ordered else 0.0
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_list(ddns, mock, zone_id, args):
+    latencies = []
+    for _ in range(args.list_runs):
+        elapsed, records = timed(ddns["get_all_dns_records"], TOKEN, zone_id)
+        if records is None:
+            raise RuntimeError("get_all_dns_records failed")
+        latencies.append(elapsed)
+    return args.list_runs, latencies
+
+
+def bench_update(ddns, mock, zone_id, args):
+    record_ids = list(mock.zones[zone_id])
+    jobs = [(record_ids[i % len(record_ids)], f"192.0.2.{i % 250 + 1}") for i in range(args.updates)]
+
+    def update(job):
+        record_id, new_ip = job
+        return timed(ddns["main_update_dns"], record_id, new_ip, TOKEN, zone_id, record_id, 1, "bench")
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(update, jobs))
+    failures = sum(1 for _, ok in results if not ok)
+    if failures:
+        print(f"  update: {failures} of {len(jobs)} update(s) failed")
+    return len(jobs), [elapsed for elapsed, _ in results]
+
+
+def bench_loop(ddns, mock, zone_id, args):
+    names = [r["name"] for r in list(mock.zones[zone_id].values())[:args.targets]]
+    targets = ddns["resolve_targets"](ddns["parse_targets"](",".join(f"{zone_id}:{n}" for n in names)), TOKEN)
+    mock.reset_counters()
+    ddns["http_request_count"] = 0
+    cycle_times = []
+    cycle_start = [time.perf_counter()]
+    real_sleep = time.sleep
+
+    def sleep(seconds):
+        if seconds < 30: # retry backoff inside a cycle, not the wait between cycles
+            return real_sleep(seconds)
+        cycle_times.append(time.perf_counter() - cycle_start[0])
+        if len(cycle_times) >= args.cycles:
+            raise CyclesDone
+        mock.rotate_ip()
+        cycle_start[0] = time.perf_counter()
+
+    mock.rotate_ip()
+    with patch("time.sleep", side_effect=sleep):
+        try:
+            ddns["run_update_loop"](targets, TOKEN, [mock.url + "/ip"], 1, 60)
+        except CyclesDone:
+            pass
+    return len(targets) * len(cycle_times), cycle_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_mock_arguments(parser)
+    parser.add_argument("--backend", choices=("requests", "lite"),
+                        default="requests" if importlib.util.find_spec("requests") else "lite")
+    parser.add_argument("--list-runs", type=int, default=5)
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--targets", type=int, default=200)
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--batch", action="store_true", help="run the loop with BATCHUPDATES")
+    parser.add_argument("--client-rate-limit", type=int, default=100000,
+                        help="the script's own CFRATELIMIT, per second (default effectively off)")
+    parser.add_argument("--scenarios", nargs="+", default=["list", "update", "loop"],
+                        choices=("list", "update", "loop"))
+    args = parser.parse_args()
+
+    mock = mock_from_arguments(args).start()
+    try:
+        ddns = load_ddns(mock, args)
+        zone_id = next(iter(mock.zones))
+        scenarios = {"list": bench_list, "update": bench_update, "loop": bench_loop}
+        print(f"backend {args.backend}, {args.records} records/zone, latency {args.latency}+/-{args.jitter} ms, "
+              f"error rate {args.error_rate}, rate limit {args.rate_limit or 'off'}/{args.rate_window}s")
+        print(f"{'scenario':<8} {'ops':>6} {'ops/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'requests':>9} {'429s':>6} {'5xx':>5} {'client':>7}")
+        for name in args.scenarios:
+            mock.reset_counters()
+            ddns["http_request_count"] = 0
+            start = time.perf_counter()
+            ops, latencies = scenarios[name](ddns, mock, zone_id, args)
+            wall = time.perf_counter() - start
+            served = sum(mock.statuses.values())
+            errors = sum(n for status, n in mock.statuses.items() if status >= 500)
+            print(f"{name:<8} {ops:>6} {ops / wall:>9.1f} {percentile(latencies, 50) * 1000:>9.1f} "
+                  f"{percentile(latencies, 99) * 1000:>9.1f} {served:>9} {mock.statuses[429]:>6} {errors:>5} "
+                  f"{ddns['http_request_count']:>7}")
+            print("         " + ", ".join(f"{route} x{n}" for route, n in sorted(mock.routes.items())))
+    finally:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
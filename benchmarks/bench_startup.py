@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Startup benchmark: import time and memory of DDNS-update.py per HTTP backend.
+
+Each run starts a fresh interpreter with ``-X importtime``, loads the script
+(without entering the update loop) and creates its HTTP session, which is
+where the backend's modules are imported. Reported per backend:
+
+- import time: sum of the cumulative ``-X importtime`` figures of top-level imports
+- setup time:  wall time to load the script and create the session
+- RSS:         resident set size after setup, from /proc/self/status
+
+Usage: python benchmarks/bench_startup.py [--runs N]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parent.parent / "DDNS-update.py"
+
+CHILD = """
+import json, runpy, sys, time
+start = time.perf_counter()
+ddns = runpy.run_path(sys.argv[1], run_name="ddns_bench")
+ddns["get_http_session"]()
+setup = time.perf_counter() - start
+rss_kb = 0
+with open("/proc/self/status") as status:
+    for line in status:
+        if line.startswith("VmRSS:"):
+            rss_kb = int(line.split()[1])
+print(json.dumps({"setup": setup, "rss_kb": rss_kb}))
+"""
+
+
+def top_level_import_us(importtime_output):
+    """Sums the cumulative time of imports made directly by the child (not nested)."""
+    total = 0
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, package = line.split("|", 2)
+        if not package.startswith("  "):
+            total += int(cumulative)
+    return total
+
+
+def run_once(backend):
+    env = dict(os.environ, HTTPBACKEND=backend, LOGLEVEL="WARNING", LOGASYNC="false")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD, str(SCRIPT)],
+        env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["import_us"] = top_level_import_us(proc.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="runs per backend (median is reported)")
+    args = parser.parse_args()
+
+    print(f"{'backend':<10} {'import ms':>10} {'setup ms':>10} {'RSS MiB':>9}")
+    for backend in ("requests", "lite"):
+        try:
+            runs = [run_once(backend) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{backend:<10} unavailable: {e}")
+            continue
+        import_ms = statistics.median(r["import_us"] for r in runs) / 1000
+        setup_ms = statistics.median(r["setup"] for r in runs) * 1000
+        rss_mib = statistics.median(r["rss_kb"] for r in runs) / 1024
+        print(f"{backend:<10} {import_ms:>10.1f} {setup_ms:>10.1f} {rss_mib:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Zone lookup benchmark: linear scans versus ZoneIndex on a synthetic zone.
+
+Builds a zone of --records synthetic DNS records (50k by default) shaped like
+the Cloudflare listing, then resolves --targets targets the way setup does:
+find the record by (name, type), then read its content by ID.
+
+- linear: find_record_details_by_name_and_type's old list comprehension
+          plus a next() scan by ID, per target
+- index:  one ZoneIndex build, then dict lookups per target
+
+Also reports the memory held by the raw records and by the index.
+
+Usage: python benchmarks/bench_zone_index.py [--records N] [--targets N ...]
+"""
+
+import argparse
+import io
+import os
+import random
+import runpy
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest.mock import patch
+
+SCRIPT = Path(__file__).resolve().parent.parent / "DDNS-update.py"
+
+
+def load_ddns():
+    with patch.dict(os.environ, {"LOGLEVEL": "ERROR", "LOGASYNC": "false"}), redirect_stdout(io.StringIO()):
+        return runpy.run_path(str(SCRIPT), run_name="ddns_bench")
+
+
+def synthetic_zone(size):
+    records = []
+    for i in range(size):
+        record_type = ("A", "AAAA", "CNAME", "TXT")[i % 4]
+        records.append({
+            "id": f"{i:032x}",
+            "zone_id": "0" * 32,
+            "zone_name": "example.com",
+            "name": f"host{i // 4}.example.com",
+            "type": record_type,
+            "content": f"198.51.{(i >> 8) & 255}.{i & 255}" if record_type == "A" else f"value-{i}",
+            "proxiable": True,
+            "proxied": False,
+            "ttl": 1,
+            "settings": {},
+            "meta": {},
+            "comment": None,
+            "tags": [],
+            "created_on": "2026-01-01T00:00:00.000000Z",
+            "modified_on": "2026-01-01T00:00:00.000000Z",
+        })
+    return records
+
+
+def linear_lookup(records, wanted):
+    for name, record_type in wanted:
+        matches = [r for r in records if r.get("name") == name and r.get("type") == record_type]
+        record_id = matches[0].get("id")
+        next(r.get("content") for r in records if r.get("id") == record_id)
+
+
+def index_lookup(ddns, records, wanted):
+    index = ddns["ZoneIndex"](records)
+    for name, record_type in wanted:
+        record_id = index.find(name, record_type)[0].id
+        index.get(record_id).content
+
+
+def measure(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def held_bytes(build):
+    tracemalloc.start()
+    obj = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del obj
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=50_000)
+    parser.add_argument("--targets", type=int, nargs="+", default=[1, 10, 100, 1000])
+    args = parser.parse_args()
+
+    ddns = load_ddns()
+    records = synthetic_zone(args.records)
+    rng = random.Random(0)
+    a_names = [(r["name"], "A") for r in records if r["type"] == "A"]
+
+    print(f"zone: {args.records} records")
+    print(f"{'targets':>8} {'linear ms':>11} {'index ms':>10} {'speedup':>8}")
+    for count in args.targets:
+        wanted = rng.sample(a_names, min(count, len(a_names)))
+        linear_ms = measure(linear_lookup, records, wanted)
+        index_ms = measure(index_lookup, ddns, records, wanted)
+        print(f"{len(wanted):>8} {linear_ms:>11.1f} {index_ms:>10.1f} {linear_ms / index_ms:>7.1f}x")
+
+    raw = held_bytes(lambda: synthetic_zone(args.records))
+    indexed = held_bytes(lambda: ddns["ZoneIndex"](synthetic_zone(args.records)))
+    print(f"memory: raw records {raw / 2**20:.1f} MiB, ZoneIndex {indexed / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Cloudflare DNS API and a public IP echo service.
+
+Routes (API routes live under /client/v4, so set CFAPIURL=http://HOST:PORT/client/v4):
+
+- GET   /zones/{zone}/dns_records        paginated listing (page, per_page, name, type)
+- GET   /zones/{zone}/dns_records/{id}   single record
+- PATCH /zones/{zone}/dns_records/{id}   update one record
+- POST  /zones/{zone}/dns_records/batch  batch of patches
+- GET   /ip, /ip6                        the current public IPv4 / IPv6 address
+
+Fault injection, applied to API routes only:
+
+- latency:    every response waits --latency ms, +/- --jitter ms
+- errors:     a --error-rate fraction of requests fail with 503
+- rate limit: requests beyond --rate-limit per --rate-window seconds get a
+              429 with Retry-After, like Cloudflare's per-token limit
+- pagination: per_page is capped at --max-per-page
+
+Usage: python benchmarks/mock_cloudflare.py [--port 8080] [--zones N] [--records N] ...
+Used in-process by benchmarks/bench_load.py.
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+API_PREFIX = "/client/v4"
+
+
+class MockCloudflare:
+    """Holds the zones and counters; serves them through start()."""
+
+    def __init__(self, zones=1, records=1000, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                 rate_limit=0, rate_window=1.0, max_per_page=5000, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.max_per_page = max_per_page
+        self.rng = random.Random(seed)
+        self.public_ip = "203.0.113.10"
+        self.public_ip6 = "2001:db8::10"
+        self.zones = {}
+        for z in range(zones):
+            zone_id = f"{z:032x}"
+            self.zones[zone_id] = {
+                f"{z:08x}{i:024x}": {
+                    "id": f"{z:08x}{i:024x}",
+                    "zone_id": zone_id,
+                    "name": f"host{i}.zone{z}.example",
+                    "type": "A",
+                    "content": f"198.51.{(i >> 8) & 255}.{i & 255}",
+                    "proxied": False,
+                    "ttl": 1,
+                    "comment": None,
+                    "modified_on": "2026-01-01T00:00:00.000000Z",
+                } for i in range(records)
+            }
+        self.lock = threading.Lock()
+        self.routes = Counter()
+        self.statuses = Counter()
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.server = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset_counters(self):
+        with self.lock:
+            self.routes.clear()
+            self.statuses.clear()
+
+    def rotate_ip(self):
+        """Moves the public IPv4 address to the next one, as after a reconnect."""
+        last = int(self.public_ip.rsplit(".", 1)[1])
+        self.public_ip = f"203.0.113.{last % 254 + 1}"
+
+    def _throttle(self):
+        """Counts an API request; returns the Retry-After seconds if it is over the limit."""
+        if not self.rate_limit:
+            return None
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= self.rate_window:
+                self.window_start, self.window_count = now, 0
+            self.window_count += 1
+            if self.window_count > self.rate_limit:
+                return max(math.ceil(self.window_start + self.rate_window - now), 1)
+        return None
+
+    def handle(self, method, path, query, body):
+        """Returns (status, headers, payload) for one request."""
+        if path in ("/ip", "/ip6"):
+            self._count(f"{method} {path}", 200)
+            return 200, {"Content-Type": "text/plain"}, self.public_ip6 if path == "/ip6" else self.public_ip
+        if not path.startswith(API_PREFIX + "/zones/"):
+            return self._reply(method, "unknown", 404, {"success": False, "errors": [{"code": 7003}]})
+
+        parts = path[len(API_PREFIX) + 1:].split("/")
+        route = f"{method} /zones/:zone/dns_records" + ("/:id" if len(parts) == 4 and parts[3] != "batch" else
+                                                      "/batch" if len(parts) == 4 else "")
+        if self.latency_ms or self.jitter_ms:
+            time.sleep(max(self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms), 0) / 1000)
+        retry_after = self._throttle()
+        if retry_after is not None:
+            return self._reply(method, route, 429, {"success": False, "errors": [{"code": 10000}]},
+                               {"Retry-After": str(retry_after)})
+        if self.error_rate and self.rng.random() < self.error_rate:
+            return self._reply(method, route, 503, {"success": False, "errors": [{"code": 10001}]})
+
+        zone = self.zones.get(parts[1])
+        if zone is None or len(parts) < 3 or parts[2] != "dns_records":
+            return self._reply(method, route, 404, {"success": False, "errors": [{"code": 7003}]})
+        if len(parts) == 3 and method == "GET":
+            return self._reply(method, route, 200, self._list(zone, query))
+        if len(parts) == 4 and parts[3] == "batch" and method == "POST":
+            patched = [self._patch(zone, p.get("id"), p) for p in (body or {}).get("patches", [])]
+            return self._reply(method, route, 200, {"success": True, "result": {"patches": [r for r in patched if r]}})
+        if len(parts) == 4:
+            record = zone.get(parts[3])
+            if method == "PATCH":
+                record = self._patch(zone, parts[3], body or {})
+            if record is None:
+                return self._reply(method, route, 404, {"success": False, "errors": [{"code": 81044}]})
+            return self._reply(method, route, 200, {"success": True, "result": record})
+        return self._reply(method, route, 405, {"success": False})
+
+    def _list(self, zone, query):
+        name, record_type = query.get("name"), query.get("type")
+        records = [r for r in zone.values()
+                   if (name is None or r["name"] == name) and (record_type is None or r["type"] == record_type)]
+        per_page = min(int(query.get("per_page", 100)), self.max_per_page)
+        page = int(query.get("page", 1))
+        return {
+            "success": True,
+            "result": records[(page - 1) * per_page:page * per_page],
+            "result_info": {"page": page, "per_page": per_page, "total_count": len(records),
+                            "total_pages": max(math.ceil(len(records) / per_page), 1)},
+        }
+
+    def _patch(self, zone, record_id, fields):
+        with self.lock:
+            record = zone.get(record_id)
+            if record is None:
+                return None
+            record.update({k: v for k, v in fields.items() if k in ("content", "ttl", "proxied", "comment")})
+            record["modified_on"] = time.strftime("%Y-%m-%dT%H:%M:%S.000000Z", time.gmtime())
+            return dict(record)
+
+    def _count(self, route, status):
+        with self.lock:
+            self.routes[route] += 1
+            self.statuses[status] += 1
+
+    def _reply(self, method, route, status, payload, headers=None):
+        self._count(route, status)
+        return status, dict({"Content-Type": "application/json"}, **(headers or {})), json.dumps(payload)
+
+    def start(self, host="127.0.0.1", port=0):
+        """Serves in a background thread. Returns self."""
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True # headers and body are separate writes
+
+            def _serve(self):
+                parts = urlsplit(self.path)
+                query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                status, headers, payload = mock.handle(self.command, parts.path, query, body)
+                data = payload.encode()
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_PATCH = do_POST = _serve
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def add_mock_arguments(parser):
+    """Adds the fault-injection options shared by this script and bench_load.py."""
+    parser.add_argument("--zones", type=int, default=1)
+    parser.add_argument("--records", type=int, default=5000, help="records per zone")
+    parser.add_argument("--latency", type=float, default=0.0, help="added latency per API request, ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latency jitter, +/- ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of API requests failing with 503")
+    parser.add_argument("--rate-limit", type=int, default=0, help="API requests allowed per window (0 = unlimited)")
+    parser.add_argument("--rate-window", type=float, default=1.0, help="rate-limit window, seconds")
+    parser.add_argument("--max-per-page", type=int, default=5000, help="largest page size served")
+
+
+def mock_from_arguments(args):
+    return MockCloudflare(args.zones, args.records, args.latency, args.jitter, args.error_rate,
+                          args.rate_limit, args.rate_window, args.max_per_page)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    mock = mock_from_arguments(args).start(args.host, args.port)
+    print(f"Serving {args.zones} zone(s) of {args.records} record(s) on {mock.url}")
+    print(f"  CFAPIURL={mock.url}{API_PREFIX} IPURL={mock.url}/ip")
+    print(f"  zone IDs: {', '.join(mock.zones)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
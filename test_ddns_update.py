@@ -1,10 +1,20 @@
 #!/usr/bin/env python3
-"""Regression check: stale Cloudflare DNS is updated on the first loop."""
+"""Regression checks: stale Cloudflare DNS is updated on the first loop."""
 
+import asyncio
+import errno
 import io
+import json
 import os
+import random
 import runpy
+import socket
+import struct
 import sys
+import tempfile
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from contextlib import redirect_stdout
 from pathlib import Path
 from unittest.mock import patch
@@ -15,7 +25,9 @@ class StopLoop(Exception):
 
 
 class Response:
-    def __init__(self, *, text="", payload=None):
+    def __init__(self, *, text="", payload=None, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
         self.text = text
         self.payload = payload
 
@@ -30,35 +42,129 @@ class FakeRequests:
     class exceptions:
         HTTPError = ConnectionError = Timeout = RequestException = Exception
 
-    def __init__(self):
+    class adapters:
+        class Retry:
+            created = []
+
+            def __init__(self, **kwargs):
+                self.kwargs = kwargs
+                FakeRequests.adapters.Retry.created.append(self)
+
+        class HTTPAdapter:
+            def __init__(self, **kwargs):
+                self.source_address = None
+
+            def init_poolmanager(self, connections, maxsize, **pool_kwargs):
+                self.source_address = pool_kwargs.get("source_address")
+
+    def __init__(self, zones=None, ip_answers=None):
+        self.zones = zones or {"zone-id": [{
+            "id": "record-id",
+            "name": "home.example.com",
+            "type": "A",
+            "content": "198.51.100.4",
+        }]}
+        self.ip_answers = ip_answers or {"https://ip.test": "203.0.113.10"}
         self.updates = []
+        self.calls = []
+        self.lock = threading.Lock()
+        self.patch_delay = 0
+        self.list_delay = 0
+        self.batch_delay = 0
+        self.ip_delay = 0
+        self.patch_timeouts = []
+        self.batches = []
+        self.batch_drops = set()
+        self.batch_rejected = False
+        self.throttle_patches = 0
+        self.in_flight = self.max_in_flight = 0
+
+    def Session(self):
+        return FakeSession(self)
+
+    def request(self, method, url, **kwargs):
+        return getattr(self, method.lower())(url, **kwargs)
 
     def get(self, url, **kwargs):
+        self.calls.append(("GET", url))
         if url.endswith("/dns_records"):
             assert kwargs["headers"] == {
                 "Authorization": "Bearer test-token",
                 "Content-Type": "application/json",
             }
-            return Response(payload={"success": True, "result": [{
-                "id": "record-id",
-                "name": "home.example.com",
-                "type": "A",
-                "content": "198.51.100.4",
-            }]})
-        assert url == "https://ip.test"
-        return Response(text="203.0.113.10")
+            threading.Event().wait(self.list_delay)
+            zone = url.split("/zones/")[1].split("/")[0]
+            params = kwargs.get("params") or {}
+            records = [r for r in self.zones[zone]
+                       if params.get("name", r["name"]) == r["name"]
+                       and params.get("type", r["type"]) == r["type"]]
+            per_page = params.get("per_page", len(records) or 1)
+            page = params.get("page", 1)
+            return Response(payload={
+                "success": True,
+                "result": records[(page - 1) * per_page:page * per_page],
+                "result_info": {"page": page, "total_pages": -(-len(records) // per_page)},
+            })
+        if "/dns_records/" in url:
+            zone, record_id = url.split("/zones/")[1].split("/dns_records/")
+            record = next((r for r in self.zones[zone] if r["id"] == record_id), None)
+            if record is None:
+                return Response(payload={"success": False}, status_code=404)
+            return Response(payload={"success": True, "result": record})
+        threading.Event().wait(self.ip_delay)
+        answer = self.ip_answers[url]
+        if isinstance(answer, dict):
+            source_address = kwargs.get("source_address")
+            answer = answer[source_address and source_address[0]]
+        return Response(text=answer)
+
+    def post(self, url, **kwargs):
+        self.calls.append(("POST", url))
+        assert url.endswith("/dns_records/batch")
+        patches = kwargs["json"]["patches"]
+        self.batches.append(patches)
+        threading.Event().wait(self.batch_delay)
+        if self.batch_rejected:
+            return Response(payload={"success": False, "errors": [{"code": 1000}]})
+        return Response(payload={"success": True, "result": {"patches": [
+            {"id": p["id"], "content": p["content"]} for p in patches if p["id"] not in self.batch_drops
+        ]}})
 
     def patch(self, url, **kwargs):
+        self.calls.append(("PATCH", url))
+        if self.throttle_patches:
+            self.throttle_patches -= 1
+            return Response(payload={"success": False}, status_code=429, headers={"Retry-After": "0"})
         self.updates.append(kwargs["json"])
+        self.patch_timeouts.append(kwargs.get("timeout"))
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        threading.Event().wait(self.patch_delay)
+        with self.lock:
+            self.in_flight -= 1
         return Response(payload={"success": True, "result": {
             "id": "record-id",
-            "content": kwargs["json"]["content"],
-            "comment": kwargs["json"]["comment"],
+            "content": kwargs["json"].get("content"),
+            "comment": kwargs["json"].get("comment"),
         }})
 
 
-def main():
-    requests = FakeRequests()
+class FakeSession:
+    """A session of FakeRequests, bound to the source address of its adapter."""
+
+    def __init__(self, requests):
+        self.requests = requests
+        self.source_address = None
+
+    def mount(self, prefix, adapter):
+        self.source_address = adapter.source_address
+
+    def request(self, method, url, **kwargs):
+        return self.requests.request(method, url, source_address=self.source_address, **kwargs)
+
+
+def run_script(requests, sleep="time.sleep", sleep_effect=StopLoop, **env_overrides):
     sys.modules["requests"] = requests
     env = {
         "DOMAIN": "example.com",
@@ -68,18 +174,638 @@ def main():
         "IPURL": "https://ip.test",
         "UPDATEINTERVAL": "60",
     }
+    env.update(env_overrides)
     with patch.dict(os.environ, env, clear=True), \
-         patch("time.sleep", side_effect=StopLoop), \
+         patch(sleep, side_effect=sleep_effect), \
          redirect_stdout(io.StringIO()):
         try:
             runpy.run_path(str(Path(__file__).with_name("DDNS-update.py")), run_name="__main__")
         except StopLoop:
             pass
 
+
+def load_module(requests):
+    sys.modules["requests"] = requests
+    with patch.dict(os.environ, {"TOKEN": "test-token"}, clear=True), redirect_stdout(io.StringIO()):
+        return runpy.run_path(str(Path(__file__).with_name("DDNS-update.py")), run_name="ddns_update")
+
+
+def check_single_record_update():
+    requests = FakeRequests()
+    run_script(requests)
+
     assert len(requests.updates) == 1
     assert requests.updates[0]["content"] == "203.0.113.10"
     assert "proxied" not in requests.updates[0]
 
 
+def check_minimal_patches():
+    def requests_with(**fields):
+        record = {"id": "record-id", "name": "home.example.com", "type": "A", "content": "198.51.100.4",
+                  "ttl": 1, "proxied": False}
+        record.update(fields)
+        return FakeRequests(zones={"zone-id": [record]})
+
+    # The record TTL is left alone unless TTL is set
+    custom_ttl = requests_with(content="203.0.113.10", ttl=300)
+    run_script(custom_ttl)
+    assert custom_ttl.updates == []
+
+    drifted_ttl = requests_with(content="203.0.113.10", ttl=300)
+    run_script(drifted_ttl, TTL="1")
+    assert drifted_ttl.updates == [{"ttl": 1}]
+
+    changed_ip = requests_with(ttl=300)
+    run_script(changed_ip, COMMENTPOLICY="off")
+    assert changed_ip.updates == [{"content": "203.0.113.10"}]
+
+    unchanged = requests_with(content="203.0.113.10")
+    run_script(unchanged, PROXIED="false")
+    assert unchanged.updates == []
+
+    proxied = requests_with(proxied=True)
+    run_script(proxied, PROXIED="false", COMMENTPOLICY="off")
+    assert proxied.updates == [{"content": "203.0.113.10", "proxied": False}]
+
+
+def check_verify_targets():
+    requests = FakeRequests(zones={"zone-id": [
+        {"id": "r1", "name": "one.example.com", "type": "A", "content": "203.0.113.10", "ttl": 1},
+        {"id": "r2", "name": "two.example.com", "type": "A", "content": "192.0.2.99", "ttl": 120},
+    ]})
+    ddns = load_module(requests)
+    one = {"zone_id": "zone-id", "name": "one.example.com", "type": "A", "record_id": "r1",
+           "current_ip": "203.0.113.10", "ttl": 1, "proxied": None}
+    two = dict(one, name="two.example.com", record_id="r2")
+
+    assert ddns["verify_targets"]([one], "test-token") == 0
+    assert requests.calls[-1] == ("GET", "https://api.cloudflare.com/client/v4/zones/zone-id/dns_records/r1")
+
+    # Two records in a zone of unknown size are read one by one, without probing the listing
+    requests.calls.clear()
+    assert ddns["verify_targets"]([one, two], "test-token") == 1
+    assert sorted(url.rsplit("/", 1)[1] for _, url in requests.calls) == ["r1", "r2"]
+
+    two.update(current_ip="198.51.100.4", ttl=1)
+    requests.calls.clear()
+    ddns["zone_listing_pages"]["zone-id"] = 1
+    assert ddns["verify_targets"]([one, two], "test-token") == 1
+    assert requests.calls == [("GET", "https://api.cloudflare.com/client/v4/zones/zone-id/dns_records")]
+    assert (two["current_ip"], two["ttl"]) == ("192.0.2.99", 120)
+    assert ddns["record_drift"](two, "203.0.113.10", 1) == {"content": "203.0.113.10", "ttl": 1}
+
+    # In a zone whose listing spans more pages than there are targets, per-record GETs are cheaper
+    requests.calls.clear()
+    ddns["zone_listing_pages"]["zone-id"] = 10
+    assert ddns["verify_targets"]([one, two], "test-token") == 0
+    assert sorted(url.rsplit("/", 1)[1] for _, url in requests.calls) == ["r1", "r2"]
+
+
+def check_config_file_reload():
+    for engine, sleep in (("sync", "time.sleep"), ("async", "asyncio.sleep")):
+        records = [{"id": n, "name": f"{n}.example.com", "type": "A", "content": "198.51.100.4"}
+                   for n in ("one", "two", "three")]
+        requests = FakeRequests(zones={"zone-id": records})
+        with tempfile.TemporaryDirectory() as config_dir:
+            config_path = Path(config_dir, "ddns.ini")
+            config_path.write_text("[DEFAULT]\nRecordType=A ; comment\n\n[one]\n[two.example.com]\n")
+
+            def edit_config_then_stop(seconds):
+                if len(requests.updates) > 2:
+                    raise StopLoop
+                config_path.write_text("[DEFAULT]\nRecordType=A\n\n[one]\n[three]\n")
+                os.utime(config_path, ns=(0, 0))
+
+            run_script(requests, sleep=sleep, sleep_effect=edit_config_then_stop, CONFIGFILE=str(config_path),
+                       ENGINE=engine)
+
+        patched = [url.rsplit("/", 1)[1] for method, url in requests.calls if method == "PATCH"]
+        listings = [url for method, url in requests.calls if method == "GET" and url.endswith("/dns_records")]
+        assert sorted(patched[:2]) == ["one", "two"] and patched[2:] == ["three"], engine
+        assert len(listings) == 2, engine # full listing at startup, filtered listing for the added target
+
+        # Without target sections at startup the NAME record runs alone until a section is added
+        requests = FakeRequests(zones={"zone-id": [dict(records[0], id="home", name="home.example.com")] + records})
+        with tempfile.TemporaryDirectory() as config_dir:
+            config_path = Path(config_dir, "ddns.ini")
+            config_path.write_text("[DEFAULT]\nRecordType=A\n\n;[two]\n")
+
+            def add_section_then_stop(seconds):
+                if len(requests.updates) > 1:
+                    raise StopLoop
+                config_path.write_text("[DEFAULT]\nRecordType=A\n\n[two]\n")
+                os.utime(config_path, ns=(0, 0))
+
+            run_script(requests, sleep=sleep, sleep_effect=add_section_then_stop, CONFIGFILE=str(config_path),
+                       ENGINE=engine)
+
+        patched = [url.rsplit("/", 1)[1] for method, url in requests.calls if method == "PATCH"]
+        assert patched == ["home", "two"], engine
+
+    ddns = load_module(FakeRequests())
+    with tempfile.TemporaryDirectory() as config_dir:
+        toml_path = Path(config_dir, "ddns.toml")
+        toml_path.write_text('zoneid = "zone-a"\nproxied = false\n\n["home.example.com"]\nrecordtype = "A,AAAA"\n')
+        settings, sections = ddns["read_config_file"](str(toml_path))
+    assert settings == {"ZONEID": "zone-a", "PROXIED": "false"}
+    targets = ddns["config_file_targets"](sections)
+    assert [(t["zone_id"], t["name"], t["type"]) for t in targets] == [
+        ("zone-a", "home.example.com", "A"), ("zone-a", "home.example.com", "AAAA")]
+
+
+def check_fleet_mode():
+    requests = FakeRequests(zones={
+        "zone-a": [
+            {"id": "a1", "name": "one.example.com", "type": "A", "content": "198.51.100.4"},
+            {"id": "a2", "name": "two.example.com", "type": "A", "content": "203.0.113.10"},
+        ],
+        "zone-b": [
+            {"id": "b1", "name": "three.example.org", "type": "A", "content": "198.51.100.4"},
+        ],
+    })
+    run_script(requests, TARGETS="zone-a:one.example.com, zone-a:two.example.com:A, zone-b:three.example.org")
+
+    ip_lookups = [c for c in requests.calls if c == ("GET", "https://ip.test")]
+    zone_fetches = [c for c in requests.calls if c[0] == "GET" and c[1].endswith("/dns_records")]
+    patched = sorted(url.rsplit("/", 1)[1] for method, url in requests.calls if method == "PATCH")
+    assert len(ip_lookups) == 1
+    assert len(zone_fetches) == 2
+    assert patched == ["a1", "b1"]
+
+
+def dual_stack_requests():
+    return FakeRequests(
+        zones={"zone-id": [
+            {"id": "v4", "name": "home.example.com", "type": "A", "content": "198.51.100.4"},
+            {"id": "v6", "name": "home.example.com", "type": "AAAA", "content": "2001:db8::4"},
+        ]},
+        ip_answers={"https://ip.test": {"0.0.0.0": "203.0.113.10", "::": "2001:db8::10"}},
+    )
+
+
+def check_dual_stack():
+    requests = dual_stack_requests()
+    run_script(requests, RECORDTYPE="A,AAAA")
+    updated = sorted((url.rsplit("/", 1)[1], u["content"]) for (method, url), u in
+                     zip([c for c in requests.calls if c[0] == "PATCH"], requests.updates))
+    assert updated == [("v4", "203.0.113.10"), ("v6", "2001:db8::10")]
+
+    requests = dual_stack_requests()
+    run_script(requests, sleep="asyncio.sleep", ENGINE="async", RECORDTYPE="A,AAAA")
+    assert sorted(u["content"] for u in requests.updates) == ["2001:db8::10", "203.0.113.10"]
+
+    requests = dual_stack_requests()
+    run_script(requests, TARGETS=":home.example.com", RECORDTYPE="AAAA,A")
+    assert sorted(u["content"] for u in requests.updates) == ["2001:db8::10", "203.0.113.10"]
+
+
+def check_async_engine():
+    requests = FakeRequests(zones={"zone-a": [
+        {"id": f"a{i}", "name": f"host{i}.example.com", "type": "A", "content": "198.51.100.4"}
+        for i in range(5)
+    ]})
+    requests.patch_delay = 0.05
+    run_script(requests, sleep="asyncio.sleep", ENGINE="async", ASYNCWORKERS="2", VERIFYEVERY="1",
+               TARGETS=",".join(f"zone-a:host{i}.example.com" for i in range(5)))
+
+    assert len(requests.updates) == 5
+    assert all(u["content"] == "203.0.113.10" for u in requests.updates)
+    assert requests.max_in_flight == 2
+    listings = [url for method, url in requests.calls if method == "GET" and url.endswith("/dns_records")]
+    assert len(listings) == 2 # resolution, then one listing verifies all five records
+
+    listed = FakeRequests()
+    list_zone = load_module(listed)["async_get_all_dns_records"]
+    list_zone.__globals__["asyncio"] = asyncio # imported by run_engine
+    with redirect_stdout(io.StringIO()):
+        records = asyncio.run(list_zone("test-token", "zone-id", "home.example.com", "A"))
+        assert [r["id"] for r in records] == ["record-id"]
+        listed.list_delay = 0.2
+        assert asyncio.run(list_zone("test-token", "zone-id", timeout=0.05)) is None
+
+        # A timed out IP lookup is counted once, by the lookup itself when it ends
+        listed.ip_delay = 0.2
+        get_ip = list_zone.__globals__["async_get_public_ip"]
+        assert asyncio.run(get_ip("https://ip.test", "A", timeout=0.05)) is None
+        threading.Event().wait(0.3)
+    stats = list_zone.__globals__["ip_provider_stats"]["https://ip.test"]
+    assert (stats["successes"], stats["failures"]) == (1, 0)
+
+    # A timed out update keeps its worker slot until its thread finishes
+    slow = FakeRequests()
+    slow.patch_delay = 0.3
+    update = load_module(slow)["async_main_update_dns"]
+    update.__globals__["asyncio"] = asyncio # imported by run_engine
+
+    async def timed_out_update():
+        semaphore = asyncio.Semaphore(1)
+        ok = await update("home.example.com", "203.0.113.10", "test-token", "zone-id", "record-id",
+                          None, "now", semaphore, 0.1)
+        held = semaphore.locked()
+        await asyncio.sleep(0.4)
+        return ok, held, semaphore.locked()
+
+    with redirect_stdout(io.StringIO()):
+        assert asyncio.run(timed_out_update()) == (False, True, False)
+    assert slow.patch_timeouts == [0.1]
+
+
+def check_state_file_skips_zone_listing():
+    with tempfile.TemporaryDirectory() as state_dir:
+        state_file = str(Path(state_dir, "state.json"))
+        first = FakeRequests()
+        run_script(first, STATEFILE=state_file)
+        assert any(url.endswith("/dns_records") for _, url in first.calls)
+
+        second = FakeRequests()
+        run_script(second, STATEFILE=state_file)
+        zone_listings = [url for _, url in second.calls if url.endswith("/dns_records")]
+        record_reads = [url for method, url in second.calls if method == "GET" and url.endswith("/dns_records/record-id")]
+        assert zone_listings == []
+        assert len(record_reads) == 1
+        assert len(second.updates) == 1
+
+    # Several cached targets in one zone are checked with a single listing read
+    with tempfile.TemporaryDirectory() as state_dir:
+        state_file = str(Path(state_dir, "state.json"))
+        targets = ",".join(f"zone-a:host{i}.example.com" for i in range(3))
+        with patch("os.replace", wraps=os.replace) as replace:
+            run_script(FakeRequests(zones=batch_zones()), TARGETS=targets, STATEFILE=state_file)
+        assert replace.call_count == 2 # once after resolution, once after the update cycle
+
+        restart = FakeRequests(zones=batch_zones())
+        run_script(restart, TARGETS=targets, STATEFILE=state_file)
+        reads = [url for method, url in restart.calls if method == "GET" and "/zones/" in url]
+        assert reads == ["https://api.cloudflare.com/client/v4/zones/zone-a/dns_records"]
+
+
+def batch_zones():
+    return {
+        "zone-a": [{"id": f"a{i}", "name": f"host{i}.example.com", "type": "A", "content": "198.51.100.4"}
+                   for i in range(3)],
+        "zone-b": [{"id": "b0", "name": "solo.example.org", "type": "A", "content": "198.51.100.4"}],
+    }
+
+
+def check_batch_updates():
+    targets = ",".join([f"zone-a:host{i}.example.com" for i in range(3)] + ["zone-b:solo.example.org"])
+    requests = FakeRequests(zones=batch_zones())
+    requests.batch_drops = {"a2"}
+    run_script(requests, TARGETS=targets, BATCHUPDATES="true")
+
+    assert [[p["id"] for p in batch] for batch in requests.batches] == [["a0", "a1", "a2"]]
+    patched = sorted(url.rsplit("/", 1)[1] for method, url in requests.calls if method == "PATCH")
+    assert patched == ["a2", "b0"]
+
+    rejected = FakeRequests(zones=batch_zones())
+    rejected.batch_rejected = True
+    run_script(rejected, TARGETS=targets, BATCHUPDATES="true")
+    patched = sorted(url.rsplit("/", 1)[1] for method, url in rejected.calls if method == "PATCH")
+    assert patched == ["a0", "a1", "a2", "b0"]
+
+    # A batch that outlives the async task timeout still lands; only what it did not confirm is patched
+    slow = FakeRequests(zones=batch_zones())
+    slow.batch_delay = 0.3
+    slow.batch_drops = {"a2"}
+    ddns = load_module(slow)
+    update_changed = ddns["async_update_changed_records"]
+    update_changed.__globals__.update(asyncio=asyncio, batch_updates=True, async_task_timeout=0.1)
+    targets = [{"zone_id": "zone-a", "name": f"host{i}.example.com", "type": "A", "record_id": f"a{i}",
+                "current_ip": "198.51.100.4", "ttl": 1, "proxied": None} for i in range(3)]
+    with redirect_stdout(io.StringIO()):
+        failed = asyncio.run(update_changed([(t, "203.0.113.10") for t in targets], "test-token", None,
+                                            asyncio.Semaphore(2)))
+    assert failed == []
+    assert [url.rsplit("/", 1)[1] for method, url in slow.calls if method == "PATCH"] == ["a2"]
+    assert all(t["current_ip"] == "203.0.113.10" for t in targets)
+
+
+def check_api_url_override():
+    requests = FakeRequests()
+    run_script(requests, CFAPIURL="http://127.0.0.1:8080/client/v4/")
+
+    api_calls = [url for _, url in requests.calls if "/zones/" in url]
+    assert api_calls and all(url.startswith("http://127.0.0.1:8080/client/v4/zones/zone-id/") for url in api_calls)
+
+
+def check_rate_limit_retry():
+    requests = FakeRequests()
+    requests.throttle_patches = 1
+    run_script(requests)
+
+    # 429s must reach the RequestScheduler instead of being retried inside urllib3
+    retry_kwargs = FakeRequests.adapters.Retry.created[-1].kwargs
+    assert 429 not in retry_kwargs["status_forcelist"]
+    assert retry_kwargs["respect_retry_after_header"] is False
+
+    patches = [c for c in requests.calls if c[0] == "PATCH"]
+    assert len(patches) == 2
+    assert len(requests.updates) == 1
+
+
+def check_scheduler_priorities():
+    ddns = load_module(FakeRequests())
+    scheduler = ddns["RequestScheduler"](requests_per_window=1000, window_seconds=1)
+    paused = Response(status_code=429, headers={"Retry-After": "0"})
+    assert scheduler.note_response("token", paused) == 0
+    scheduler.windows["token"].blocked_until = scheduler.clock() + 0.2
+
+    order = []
+    def send(priority, label):
+        scheduler.acquire("token", priority)
+        order.append(label)
+    read = threading.Thread(target=send, args=(scheduler.PRIORITY_READ, "read"))
+    update = threading.Thread(target=send, args=(scheduler.PRIORITY_UPDATE, "update"))
+    read.start()
+    threading.Event().wait(0.05)
+    update.start()
+    threading.Event().wait(0.05)
+    assert scheduler.queue_depth() == 2
+    read.join()
+    update.join()
+
+    assert order == ["update", "read"]
+    assert scheduler.stats()["throttled"] == 1
+
+    # No window of 10 seconds ever holds more than 3 requests, including the first
+    limit = ddns["SlidingWindowLimit"](3, 10.0)
+    for now in (0.0, 1.0, 2.0):
+        assert limit.delay(now) == 0
+        limit.take(now)
+    assert limit.delay(5.0) == 5.0
+    assert limit.delay(10.0) == 0
+    limit.take(10.0)
+    assert limit.delay(10.5) == 0.5
+
+
+def check_metrics_endpoint():
+    ddns = load_module(FakeRequests())
+    metrics = ddns["metrics"]
+    metrics.observe("ddns_ip_lookup_seconds", 0.07, {"provider": "https://ip.test"})
+    metrics.inc("ddns_updates_total", {"record": 'odd"name', "type": "A"})
+    with redirect_stdout(io.StringIO()):
+        server = ddns["start_metrics_server"](0, "127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        body = urllib.request.urlopen(url, timeout=5).read().decode()
+    finally:
+        server.shutdown()
+
+    assert '# TYPE ddns_ip_lookup_seconds histogram' in body
+    assert 'ddns_ip_lookup_seconds_bucket{provider="https://ip.test",le="0.05"} 0' in body
+    assert 'ddns_ip_lookup_seconds_bucket{provider="https://ip.test",le="0.1"} 1' in body
+    assert 'ddns_ip_lookup_seconds_count{provider="https://ip.test"} 1' in body
+    assert 'ddns_updates_total{record="odd\\"name",type="A"} 1' in body
+    assert 'ddns_scheduler_queue_depth 0' in body
+
+
+def check_summarized_json_logging():
+    ddns = load_module(FakeRequests())
+    stream = io.StringIO()
+    ddns["configure_logging"]("INFO", "json", async_output=True, stream=stream)
+    target = {"zone_id": "zone-id", "name": "home.example.com", "type": "A",
+              "record_id": "record-id", "current_ip": "203.0.113.10"}
+    for _ in range(24):
+        assert ddns["record_needs_update"](target, "203.0.113.10") is False
+    assert ddns["record_needs_update"](target, "203.0.113.11") is True
+    ddns["flush_logging"]()
+
+    entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [e["level"] for e in entries] == ["info", "info", "info", "warning"]
+    assert "for 24 consecutive check(s)" in entries[2]["msg"]
+    assert entries[3]["event"] == "ip_change" and entries[3]["new_ip"] == "203.0.113.11"
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    seen = []
+    fail_next = 0
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode() if length else ""
+        EchoHandler.seen.append((self.command, self.path, self.client_address[1], body))
+        status = 200
+        if EchoHandler.fail_next:
+            EchoHandler.fail_next -= 1
+            status = 503
+        payload = json.dumps({"path": self.path, "body": body}).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_PATCH = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+def check_lite_backend():
+    ddns = load_module(FakeRequests())
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        session = ddns["LiteSession"](pool_size=2, retries=2, backoff_max=0)
+        first = session.request("GET", base + "/records", params={"page": 2, "name": "a b"}, timeout=5)
+        EchoHandler.fail_next = 1
+        second = session.request("PATCH", base + "/records/1", json={"content": "203.0.113.10"}, timeout=5)
+    finally:
+        server.shutdown()
+
+    assert first.status_code == 200 and first.json()["path"] == "/records?page=2&name=a+b"
+    assert second.status_code == 200 and json.loads(second.json()["body"]) == {"content": "203.0.113.10"}
+    assert [m for m, *_ in EchoHandler.seen] == ["GET", "PATCH", "PATCH"]
+    assert len({port for _, _, port, _ in EchoHandler.seen}) == 1  # one kept-alive connection
+    failed = ddns["LiteResponse"]("GET", base, 404, "Not Found", {}, b"")
+    try:
+        failed.raise_for_status()
+    except ddns["LiteHTTPErrors"].HTTPError:
+        pass
+    else:
+        raise AssertionError("404 did not raise")
+
+    # Sessions (one per source address with IPFAMILYBIND) share one TLS context, made on first HTTPS use
+    namespace = ddns["get_tls_context"].__globals__
+    assert namespace["_tls_context"] is None
+    sessions = [ddns["LiteSession"](2, 0, 0, source_address=(address, 0)) for address in ("127.0.0.1", "::1")]
+    contexts = {id(s._connect("https", "api.cloudflare.com", 443, 5)._context) for s in sessions}
+    assert contexts == {id(namespace["_tls_context"])}
+
+
+def check_record_id_lookup():
+    filler = [{"id": f"r{i}", "name": f"h{i}.example.com", "type": "A", "content": "192.0.2.1"}
+              for i in range(5000)]
+    target = {"id": "record-id", "name": "home.example.com", "type": "A", "content": "198.51.100.4"}
+    requests = FakeRequests(zones={"zone-id": filler + [target] + filler[:10]})
+    run_script(requests, RECORDID="record-id")
+
+    reads = [url for method, url in requests.calls if method == "GET" and "/zones/" in url]
+    assert reads == ["https://api.cloudflare.com/client/v4/zones/zone-id/dns_records/record-id"]
+    assert len(requests.updates) == 1
+
+
+def check_zone_index():
+    ddns = load_module(FakeRequests())
+    index = ddns["ZoneIndex"]([
+        {"id": "a1", "name": "home.example.com", "type": "A", "content": "192.0.2.1", "tags": []},
+        {"id": "a2", "name": "home.example.com", "type": "A", "content": "192.0.2.2"},
+        {"id": "q1", "name": "home.example.com", "type": "AAAA", "content": "2001:db8::1"},
+    ])
+    assert len(index) == 3
+    assert [r.id for r in index.find("home.example.com", "A")] == ["a1", "a2"]
+    assert index.find("other.example.com", "A") == []
+    assert index.get("q1").get("content") == "2001:db8::1"
+    assert index.get("missing") is None
+    assert not hasattr(index.get("a1"), "tags")
+
+
+def check_ip_quorum():
+    requests = FakeRequests(ip_answers={
+        "https://ip.test": "203.0.113.10",
+        "https://ip2.test": "203.0.113.99",
+        "https://ip3.test": "203.0.113.10\n",
+        "https://ip4.test": "not-an-ip",
+    })
+    run_script(requests, IPURL="https://ip.test,https://ip2.test,https://ip3.test,https://ip4.test", IPQUORUM="2")
+
+    assert len(requests.updates) == 1
+    assert requests.updates[0]["content"] == "203.0.113.10"
+
+    # One provider at a time: the quorum is reached before the fourth is asked
+    raced = FakeRequests(ip_answers=requests.ip_answers)
+    run_script(raced, sleep="asyncio.sleep", ENGINE="async", IPQUORUM="2", IPRACEWIDTH="1",
+               IPURL="https://ip.test,https://ip2.test,https://ip3.test,https://ip4.test")
+    assert [url for _, url in raced.calls if "/zones/" not in url] == ["https://ip.test", "https://ip2.test", "https://ip3.test"]
+    assert raced.updates[0]["content"] == "203.0.113.10"
+
+
+def check_ip_family_validation():
+    requests = FakeRequests(ip_answers={"https://ip.test": "2001:db8::1"})
+    run_script(requests)
+
+    assert requests.updates == []
+
+
+def simulate_checks(pacer, seconds, outcome):
+    """Runs a pacer against a simulated clock. Returns the number of checks and the waits."""
+    clock, waits = 0.0, []
+    while clock < seconds:
+        waits.append(pacer.next_delay(outcome(len(waits))))
+        clock += waits[-1]
+    return len(waits), waits
+
+
+def check_adaptive_interval():
+    ddns = load_module(FakeRequests())
+    day = 24 * 3600
+
+    stable_checks, waits = simulate_checks(
+        ddns["AdaptiveInterval"](60, 900, 0.1, rng=random.Random(1).random), day, lambda i: "stable")
+    assert 96 <= stable_checks <= 110 # 86400 / 900, plus the ramp-up
+    assert all(54 <= w <= 990 for w in waits)
+    assert max(waits) > 900 and min(waits[-20:]) < 900 # jittered both ways around the ceiling
+
+    busy_checks, _ = simulate_checks(
+        ddns["AdaptiveInterval"](60, 900, 0.1, rng=random.Random(1).random), day, lambda i: "changed")
+    assert 1300 <= busy_checks <= 1600 # held at the 60s minimum
+
+    pacer = ddns["AdaptiveInterval"](60, 900, 0.1, rng=lambda: 0.5)
+    assert [round(pacer.next_delay(o)) for o in ("stable", "stable", "failed", "stable")] == [90, 135, 60, 90]
+
+    first = simulate_checks(ddns["AdaptiveInterval"](60, 900, 0.1, rng=random.Random(2).random), 3600, lambda i: "stable")[1]
+    second = simulate_checks(ddns["AdaptiveInterval"](60, 900, 0.1, rng=random.Random(3).random), 3600, lambda i: "stable")[1]
+    assert first != second # restarted instances drift out of phase
+
+
+def netlink_message(msg_type):
+    return struct.pack("=IHHII", 16, msg_type, 0, 0, 0)
+
+
+def check_netlink_watcher():
+    ddns = load_module(FakeRequests())
+    kernel, listener = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    watcher = ddns["AddressChangeWatcher"]("netlink", fallback_interval=0.2, sock=listener)
+    watcher.DEBOUNCE_SECONDS = 0.01
+
+    kernel.send(netlink_message(16) + netlink_message(ddns["RTM_NEWADDR"]))
+    kernel.send(netlink_message(ddns["RTM_DELADDR"]))
+    assert watcher.wait() is True
+    assert watcher.wait() is False  # burst was drained, fallback elapses
+
+    kernel.send(netlink_message(16))  # RTM_NEWLINK is not an address change
+    assert watcher.wait() is False
+
+    class OverrunSocket:
+        """Fails the first receive with ENOBUFS, like a netlink socket that dropped events."""
+        def __init__(self, sock):
+            self.sock, self.overruns = sock, 1
+        def fileno(self):
+            return self.sock.fileno()
+        def recv(self, size):
+            if self.overruns:
+                self.overruns -= 1
+                raise OSError(errno.ENOBUFS, "No buffer space available")
+            return self.sock.recv(size)
+
+    watcher.sock = OverrunSocket(listener)
+    kernel.send(netlink_message(16))
+    with redirect_stdout(io.StringIO()):
+        assert watcher.wait() is True  # events were lost, so an address may have changed
+    assert watcher.mode == "netlink"
+    assert watcher.wait() is False
+
+
+def check_poll_watcher():
+    ddns = load_module(FakeRequests())
+    with tempfile.TemporaryDirectory() as proc_net:
+        if_inet6 = Path(proc_net, "if_inet6")
+        if_inet6.write_text("20010db8000000000000000000000001 02 40 00 80 eth0\n")
+        watcher = ddns["AddressChangeWatcher"]("poll", fallback_interval=0.1, poll_interval=0.01, proc_net=proc_net)
+        assert watcher.wait() is False
+
+        if_inet6.write_text("20010db8000000000000000000000002 02 40 00 80 eth0\n")
+        assert watcher.wait() is True
+
+    # A failed lookup is retried after UPDATEINTERVAL, not at the next address change
+    for engine in ("sync", "async"):
+        for answer, longest_wait in (("not-an-ip", 60), ("203.0.113.10", 120)):
+            waits = []
+
+            def record_wait(seconds):
+                waits.append(seconds)
+                raise StopLoop
+
+            run_script(FakeRequests(ip_answers={"https://ip.test": answer}), sleep="time.sleep", sleep_effect=record_wait,
+                       ENGINE=engine, WATCHMODE="poll", WATCHPOLLINTERVAL="120")
+            assert longest_wait - 1 < waits[0] <= longest_wait, (engine, answer, waits)
+
+
+def main():
+    check_single_record_update()
+    check_minimal_patches()
+    check_verify_targets()
+    check_fleet_mode()
+    check_config_file_reload()
+    check_dual_stack()
+    check_async_engine()
+    check_batch_updates()
+    check_rate_limit_retry()
+    check_api_url_override()
+    check_scheduler_priorities()
+    check_metrics_endpoint()
+    check_summarized_json_logging()
+    check_lite_backend()
+    check_record_id_lookup()
+    check_zone_index()
+    check_state_file_skips_zone_listing()
+    check_ip_quorum()
+    check_ip_family_validation()
+    check_netlink_watcher()
+    check_poll_watcher()
+    check_adaptive_interval()
+
+
 if __name__ == "__main__":
     main()